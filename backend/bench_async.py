@@ -0,0 +1,91 @@
+"""
+Compare the sync Flask worker with the async ASGI app under concurrent
+quiz sessions.
+
+    python bench_async.py [--users 25,100,200] [--duration 10] [--database URL]
+
+Each server is started as a subprocess on a free port and driven with the
+quiz flow from loadtest.py. Without --database both serve a temporary
+SQLite copy of trivia.psql. --sync-command / --async-command replace the
+default servers, e.g. to measure a gunicorn configuration:
+
+    --sync-command "gunicorn -w 4 --threads 8 -b 127.0.0.1:{port} 'flaskr:create_app()'"
+"""
+import argparse
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+import loadtest
+
+SYNC_COMMAND = f'{sys.executable} -m flask run --with-threads --port {{port}}'
+ASYNC_COMMAND = (f'{sys.executable} -m uvicorn flaskr.asgi:create_async_app --factory '
+                 f'--port {{port}} --log-level warning')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve(command, database):
+    port = free_port()
+    server = subprocess.Popen(
+        shlex.split(command.format(port=port)),
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=dict(os.environ, DATABASE_URL=database),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url + '/categories').status_code == 200:
+                return server, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.kill()
+    raise SystemExit(f'server did not start: {command}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', default='25,100,200', help='comma-separated concurrent quiz sessions')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per step')
+    parser.add_argument('--database', help='database URL (default: temporary SQLite file)')
+    parser.add_argument('--sync-command', default=SYNC_COMMAND)
+    parser.add_argument('--async-command', default=ASYNC_COMMAND)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = args.database or 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        loadtest.in_process_app(database, {})
+
+        print(f'{"server":<8}{"users":>6}{"req/s":>9}{"failed":>8}{"p50 ms":>9}{"p99 ms":>9}')
+        for name, command in (('sync', args.sync_command), ('async', args.async_command)):
+            server, url = serve(command, database)
+            try:
+                for users in (int(n) for n in args.users.split(',')):
+                    recorder = loadtest.run(
+                        lambda recorder: loadtest.Client(recorder, base_url=url),
+                        {'quiz': 1}, users, args.duration, seed=1
+                    )
+                    total, failed, p99 = recorder.summary()
+                    p50 = loadtest.percentile(sorted(recorder.latencies['POST /quizzes']), 50) * 1000
+                    print(f'{name:<8}{users:>6}{total / recorder.elapsed:>9.1f}{failed:>8}'
+                          f'{p50:>9.1f}{p99:>9.1f}')
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == '__main__':
+    main()
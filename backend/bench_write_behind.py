@@ -0,0 +1,74 @@
+"""
+Benchmark POST /questions throughput in sync and write-behind modes.
+
+    python bench_write_behind.py [--questions 2000] [--threads 16] [--database URL]
+
+Without --database each mode runs against a fresh SQLite file, which
+fsyncs on every commit much like Postgres does.
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flaskr import create_app
+from models import db, Category
+
+MODES = [
+    ('sync', {'QUESTION_WRITE_MODE': 'sync'}),
+    ('batched/flush', {'QUESTION_WRITE_MODE': 'batched', 'WRITE_BEHIND_DURABILITY': 'flush'}),
+    ('batched/async', {'QUESTION_WRITE_MODE': 'batched', 'WRITE_BEHIND_DURABILITY': 'async'}),
+]
+
+
+def run(config, questions, threads):
+    app = create_app(config)
+    with app.app_context():
+        if not Category.query.count():
+            db.session.add(Category(type='Science'))
+            db.session.commit()
+        category_id = Category.query.first().id
+
+    client = app.test_client()
+
+    def post(i):
+        return client.post('/questions', json={
+            'question': f'Benchmark question {i}',
+            'answer': 'answer',
+            'category': category_id,
+            'difficulty': 1
+        }).status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        statuses = list(pool.map(post, range(questions)))
+    writer = app.extensions.get('question_writer')
+    if writer:
+        writer.close()
+    elapsed = time.perf_counter() - start
+
+    errors = sum(status != 200 for status in statuses)
+    batches = writer.batches if writer else questions
+    return questions / elapsed, errors, batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--questions', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--database', help='database URL (default: temporary SQLite file)')
+    args = parser.parse_args()
+
+    print(f'{"mode":<16}{"inserts/s":>12}{"commits":>10}{"errors":>8}')
+    for name, config in MODES:
+        with tempfile.TemporaryDirectory() as tmp:
+            url = args.database or 'sqlite:///' + os.path.join(tmp, 'bench.db')
+            rate, errors, commits = run(
+                dict(config, SQLALCHEMY_DATABASE_URI=url), args.questions, args.threads
+            )
+        print(f'{name:<16}{rate:>12.0f}{commits:>10}{errors:>8}')
+
+
+if __name__ == '__main__':
+    main()
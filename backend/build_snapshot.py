@@ -0,0 +1,35 @@
+"""
+Compile the question bank into a read-only snapshot file (see flaskr/snapshot.py).
+
+    python build_snapshot.py trivia.snap --dump trivia.psql
+    python build_snapshot.py trivia.snap [--database URL]
+"""
+import argparse
+import os
+
+from dotenv import load_dotenv
+
+from flaskr.snapshot import read_database, read_psql_dump, write_snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile a trivia question bank snapshot.')
+    parser.add_argument('output', help='snapshot file to write')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--dump', help='plain-format pg_dump file, e.g. trivia.psql')
+    source.add_argument('--database', help='database URL (default: $DATABASE_URL)')
+    args = parser.parse_args()
+
+    if args.dump:
+        tables = read_psql_dump(args.dump)
+    else:
+        load_dotenv()
+        tables = read_database(args.database or os.getenv('DATABASE_URL'))
+
+    write_snapshot(args.output, tables)
+    print(f"wrote {len(tables['questions'])} questions in "
+          f"{len(tables['categories'])} categories to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
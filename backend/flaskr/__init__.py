@@ -1,27 +1,336 @@
 
 from flask import Flask, request, abort, jsonify
 from flask_cors import CORS
+import os
 import random
+from concurrent.futures import ThreadPoolExecutor
 
 
-from models import setup_db, Question, Category, db
+from models import setup_db, question_scopes, question_search, Question, Category, db
+from .admission import AdmissionControl
+from .batch import parse_batch, run_batch
+from .cache import VersionedCache
+from .page_cache import PageCache, pages_of
+from .slow_queries import SlowQueryLog
+from .snapshot import Snapshot, QuestionList
+from .write_behind import QuestionWriter, BATCHED
 
 QUESTIONS_PER_PAGE = 10
 
-def paginate_questions(request, selection):
+# the messages of the JSON error responses, and the CORS headers added to
+# every response, of both create_app() and the ASGI app (see asgi.py)
+ERROR_MESSAGES = {
+    404: 'resource not found',
+    405: 'method not allowed',
+    422: 'request cannot be processed',
+}
+CORS_HEADERS = {
+    'Access-Control-Allow-Headers': 'Content-Type,Authorization,true',
+    'Access-Control-Allow-Methods': 'GET,PUT,POST,DELETE,OPTIONS',
+    'Access-Control-Allow-Origin': '*',
+}
+
+"""
+page_of(request, selection)
+    the questions of selection on the page requested by ?page=
+"""
+def page_of(request, selection):
     page = request.args.get("page", 1, type=int)
     start = (page - 1) * QUESTIONS_PER_PAGE
     end = start + QUESTIONS_PER_PAGE
 
-    current_question = [question.format() for question in selection[start:end]]
+    return selection[start:end]
+
+
+"""
+The JSON bodies of the routes, shared by the database routes, the snapshot
+routes and the ASGI app, so the three answer alike. page is the list of
+questions to return, out of total; categories are (id, type) pairs in id
+order.
+"""
+def error_body(status):
+    return {'success': False, 'error': status, 'message': ERROR_MESSAGES[status]}
+
+def categories_body(categories):
+    return {
+        'success': True,
+        'categories': dict(categories)
+    }
+
+def questions_body(page, total, categories):
+    category_types = [type for _, type in categories]
+
+    return {
+        'success': True,
+        'questions': [question.format() for question in page],
+        'total_questions': total,
+        'categories': category_types,
+        # the current category defaults to the first category
+        'current_category': category_types[0] if category_types else None
+    }
+
+def search_body(page, total):
+    return {
+        "success": True,
+        "questions": [question.format() for question in page],
+        "total_questions": total
+    }
+
+def category_questions_body(category_type, page, total):
+    if not total:
+        return {
+            "success": True,
+            "message": "No questions found for this category",
+            "current_category": category_type
+        }
+
+    return {
+        "success": True,
+        "questions": [question.format() for question in page],
+        "total_questions": total,
+        "current_category": category_type
+    }
+
+def quiz_body(question):
+    return {
+        'success': True,
+        'question': question.format() if question else None
+    }
+
+"""
+quiz_request(body)
+    the previous question ids and the category id of a POST /quizzes body;
+    the category id is None to play all categories
+"""
+def quiz_request(body):
+    if not body or 'previous_questions' not in body:
+        abort(400, {'message': 'Please provide a JSON body with previous question Ids and optional category.'})
+
+    previous_questions = body.get('previous_questions', [])
+    current_category = body.get('quiz_category', None)
+
+    if current_category and current_category['id'] != 0:
+        return previous_questions, current_category['id']
+    return previous_questions, None
+
+
+"""
+create_snapshot_routes(app, snapshot)
+    registers the read routes served from a Snapshot, with the same
+    responses as their database-backed versions below. The snapshot is
+    read-only, so adding and deleting questions answer 405.
+"""
+def create_snapshot_routes(app, snapshot):
+
+    @app.route('/categories')
+    def get_categories():
+        categories = snapshot.categories()
+
+        if not categories:
+            abort(404)
+
+        return jsonify(categories_body(categories))
+
+    @app.route('/questions')
+    def get_questions():
+        questions = snapshot.questions()
+
+        page = page_of(request, questions)
+
+        if not page:
+            abort(404)
+
+        return jsonify(questions_body(page, len(questions), snapshot.categories()))
+
+    @app.route('/questions', methods=['POST'])
+    @app.route('/questions/<int:question_id>', methods=['DELETE'])
+    def read_only(question_id=None):
+        abort(405)
+
+    @app.route('/questions/search', methods=['POST'])
+    def search_questions():
+        search_term = request.get_json().get('searchTerm', '')
+
+        questions = snapshot.search(search_term)
+
+        return jsonify(search_body(page_of(request, questions), len(questions)))
+
+    @app.route('/categories/<int:category_id>/questions', methods=['GET'])
+    def category_questions(category_id):
+        category = snapshot.category(category_id)
+        if not category:
+            abort(404)
+
+        category_type, selection = category
+
+        return jsonify(category_questions_body(
+            category_type, page_of(request, selection), len(selection)
+        ))
+
+    @app.route('/quizzes', methods=['POST'])
+    def start_trivia():
+        previous_questions, category_id = quiz_request(request.get_json())
+
+        if category_id is not None:
+            try:
+                category = snapshot.category(int(category_id))
+            except (TypeError, ValueError):
+                category = None
+            questions = category[1] if category else QuestionList(snapshot, [])
+        else:
+            questions = snapshot.questions()
+
+        if previous_questions:
+            questions = questions.excluding(previous_questions)
+
+        return jsonify(quiz_body(random.choice(questions) if questions else None))
 
-    return current_question
+
+"""
+optional_float(value)
+    value, a setting read from the environment, as a float; '' and 'None'
+    are None, which turns the setting off
+"""
+def optional_float(value):
+    if value is None or value.strip() in ('', 'None'):
+        return None
+    return float(value)
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+
+    # SNAPSHOT_PATH serves the read routes from a compiled snapshot file
+    # instead of the database (see snapshot.py)
+    # QUESTION_WRITE_MODE is 'sync' (commit per insert) or 'batched'
+    # (write-behind, see write_behind.py)
+    # DATA_VERSION_* set how often, in milliseconds, cached data is checked
+    # against the data_versions table, and LISTEN/NOTIFY (see cache.py)
+    # ADMISSION_* are per-endpoint concurrency and rate limits, e.g.
+    # {'search_questions': {'concurrency': 4, 'rate': 20, 'burst': 40}}
+    # (see admission.py)
+    # BATCH_* bound POST /batch: sub-requests per call, and threads running
+    # its reads concurrently (see batch.py)
+    # SLOW_QUERY_* set the slow-query log: threshold in milliseconds (None
+    # turns it off), the fraction of slow SELECTs EXPLAINed, how many
+    # entries are kept, and where POST /admin/slow-queries/dump writes them
+    # (see slow_queries.py)
+    # ADMIN_ROUTES serves the /admin routes (admission stats, slow-query
+    # log); they have no access control, so leave it off on public servers
+    # PAGE_CACHE_* set how many pages of each question listing are kept
+    # serialised (0 turns it off), the bytes they may take in total, and
+    # how long, in milliseconds, a read after this worker's own change
+    # waits for the rebuild before it is served the stale page
+    # (see page_cache.py)
+    app.config.from_mapping(
+        SNAPSHOT_PATH=os.getenv('SNAPSHOT_PATH'),
+        QUESTION_WRITE_MODE=os.getenv('QUESTION_WRITE_MODE', 'sync'),
+        WRITE_BEHIND_BATCH_SIZE=100,
+        WRITE_BEHIND_FLUSH_INTERVAL=0.05,
+        WRITE_BEHIND_DURABILITY='flush',
+        WRITE_BEHIND_ID_BLOCK=100,
+        DATA_VERSION_CHECK_INTERVAL=100,
+        DATA_VERSION_LISTEN=os.getenv('DATA_VERSION_LISTEN') == '1',
+        ADMISSION_LIMITS={},
+        ADMISSION_EXPENSIVE_CONCURRENCY=None,
+        BATCH_MAX_REQUESTS=20,
+        BATCH_WORKERS=4,
+        SLOW_QUERY_THRESHOLD=optional_float(os.getenv('SLOW_QUERY_THRESHOLD', '250')),
+        SLOW_QUERY_EXPLAIN_SAMPLE=0.1,
+        SLOW_QUERY_LOG_SIZE=200,
+        SLOW_QUERY_DUMP_PATH=os.getenv('SLOW_QUERY_DUMP_PATH', 'slow_queries.jsonl'),
+        ADMIN_ROUTES=os.getenv('ADMIN_ROUTES') == '1',
+        PAGE_CACHE_PAGES=3,
+        PAGE_CACHE_MAX_BYTES=8 * 1024 * 1024,
+        PAGE_CACHE_REBUILD_WAIT=250,
+    )
+    if test_config:
+        app.config.from_mapping(test_config)
+
+    snapshot = None
+    if app.config['SNAPSHOT_PATH']:
+        snapshot = Snapshot(app.config['SNAPSHOT_PATH'])
+        app.extensions['snapshot'] = snapshot
+    elif 'SQLALCHEMY_DATABASE_URI' in app.config:
+        setup_db(app, app.config['SQLALCHEMY_DATABASE_URI'])
+    else:
+        setup_db(app)
+
+    writer = None
+    if not snapshot and app.config['QUESTION_WRITE_MODE'] == BATCHED:
+        writer = QuestionWriter(
+            app,
+            batch_size=app.config['WRITE_BEHIND_BATCH_SIZE'],
+            flush_interval=app.config['WRITE_BEHIND_FLUSH_INTERVAL'],
+            durability=app.config['WRITE_BEHIND_DURABILITY'],
+            id_block=app.config['WRITE_BEHIND_ID_BLOCK'],
+        )
+        app.extensions['question_writer'] = writer
+
+    cache = None
+    if not snapshot:
+        cache = VersionedCache(
+            app,
+            check_interval=app.config['DATA_VERSION_CHECK_INTERVAL'],
+            listen=app.config['DATA_VERSION_LISTEN'],
+        )
+        app.extensions['cache'] = cache
+
+    page_cache = None
+    if cache and app.config['PAGE_CACHE_PAGES']:
+        page_cache = PageCache(
+            app,
+            cache,
+            pages=app.config['PAGE_CACHE_PAGES'],
+            max_bytes=app.config['PAGE_CACHE_MAX_BYTES'],
+            rebuild_wait=app.config['PAGE_CACHE_REBUILD_WAIT'],
+        )
+        app.extensions['page_cache'] = page_cache
+
+    slow_queries = None
+    if not snapshot and app.config['SLOW_QUERY_THRESHOLD'] is not None:
+        with app.app_context():
+            slow_queries = SlowQueryLog(
+                db.engine,
+                threshold_ms=app.config['SLOW_QUERY_THRESHOLD'],
+                explain_sample=app.config['SLOW_QUERY_EXPLAIN_SAMPLE'],
+                size=app.config['SLOW_QUERY_LOG_SIZE'],
+            )
+        app.extensions['slow_queries'] = slow_queries
+
+    def load_categories():
+        return [(c.id, c.type) for c in Category.query.order_by(Category.id)]
+
+    def build_question_pages():
+        questions = Question.query.order_by(Question.id).all()
+        categories = cache.get('categories', ('categories',), load_categories)
+
+        return [
+            jsonify(questions_body(page, len(questions), categories)).get_data() if page else None
+            for page in pages_of(questions, page_cache.pages, QUESTIONS_PER_PAGE)
+        ]
+
+    def build_category_pages(category_id):
+        category = Category.query.get(category_id)
+        if not category:
+            return None
+
+        selection = Question.query.filter_by(category=str(category_id)).all()
+
+        return [
+            jsonify(category_questions_body(category.type, page, len(selection))).get_data()
+            if page or not selection else None
+            for page in pages_of(selection, page_cache.pages, QUESTIONS_PER_PAGE)
+        ]
+
+    def cached_page(listing, scopes, build):
+        if not page_cache:
+            return None
+        body = page_cache.get(listing, request.args.get('page', 1, type=int), scopes, build)
+        if body is None:
+            return None
+        return app.response_class(body, mimetype=app.config['JSONIFY_MIMETYPE'])
 
     """
     @DONE: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -34,17 +343,84 @@ def create_app(test_config=None):
     """
     @app.after_request
     def after_request(response):
-        response.headers.add(
-            "Access-Control-Allow-Headers", "Content-Type,Authorization,true"
-        )
-        response.headers.add(
-            "Access-Control-Allow-Methods", "GET,PUT,POST,DELETE,OPTIONS"
-        )
-        response.headers.add(
-            "Access-Control-Allow-Origin", "*"
-        )
+        for name, value in CORS_HEADERS.items():
+            response.headers.add(name, value)
         return response
 
+    """
+    @DONE:
+    Create error handlers for all expected errors
+    including 404 and 422.
+    """
+    @app.errorhandler(404)
+    def not_found(error):
+        return jsonify(error_body(404)), 404
+
+    @app.errorhandler(422)
+    def unprocessed(error):
+        return jsonify(error_body(422)), 422
+
+    @app.errorhandler(405)
+    def not_allowed(error):
+        return jsonify(error_body(405)), 405
+
+    admission = AdmissionControl(
+        app,
+        app.config['ADMISSION_LIMITS'],
+        expensive_concurrency=app.config['ADMISSION_EXPENSIVE_CONCURRENCY'],
+    )
+
+    batch_executor = ThreadPoolExecutor(
+        max_workers=app.config['BATCH_WORKERS'], thread_name_prefix='batch'
+    )
+
+    @app.route('/batch', methods=['POST'])
+    def batch():
+        body = request.get_json()
+
+        try:
+            requests = parse_batch(
+                body.get('requests') if isinstance(body, dict) else None,
+                app.config['BATCH_MAX_REQUESTS']
+            )
+        except ValueError:
+            abort(422)
+
+        return jsonify({
+            'success': True,
+            'responses': run_batch(app, requests, batch_executor)
+        })
+
+    if app.config['ADMIN_ROUTES']:
+        @app.route('/admin/admission')
+        def admission_stats():
+            return jsonify({
+                'success': True,
+                'admission': admission.stats()
+            })
+
+    if app.config['ADMIN_ROUTES'] and slow_queries:
+        @app.route('/admin/slow-queries')
+        def slow_query_log():
+            return jsonify({
+                'success': True,
+                'threshold_ms': app.config['SLOW_QUERY_THRESHOLD'],
+                'slow_queries': slow_queries.entries()
+            })
+
+        @app.route('/admin/slow-queries/dump', methods=['POST'])
+        def dump_slow_queries():
+            path = app.config['SLOW_QUERY_DUMP_PATH']
+            return jsonify({
+                'success': True,
+                'path': path,
+                'dumped': slow_queries.dump(path)
+            })
+
+    if snapshot:
+        create_snapshot_routes(app, snapshot)
+        return app
+
     """
     @DONE:
     Create an endpoint to handle GET requests
@@ -54,18 +430,12 @@ def create_app(test_config=None):
     def get_categories():
         # http://127.0.0.1:5000/categories
 
-        categories = db.session.query(Category).order_by(Category.id).all()
+        categories = cache.get('categories', ('categories',), load_categories)
 
         if not categories:
             abort(404)
 
-        category_dict = {item.id: item.type for item in categories}
-        response = {
-            'success': True,
-            'categories': category_dict
-        }
-
-        return jsonify(response)
+        return jsonify(categories_body(categories))
 
 
     """
@@ -84,29 +454,20 @@ def create_app(test_config=None):
     def get_questions():
         # http://127.0.0.1:5000/questions?page=2
 
+        response = cached_page('questions', ('questions', 'categories'), build_question_pages)
+        if response:
+            return response
+
         questions = Question.query.order_by(Question.id).all()
 
-        questions_paginated = paginate_questions(request, questions)
+        page = page_of(request, questions)
 
-        if not questions_paginated:
+        if not page:
             abort(404)
 
-        categories = Category.query.all()
+        categories = cache.get('categories', ('categories',), load_categories)
 
-        categories_returned = [category.format()['type'] for category in categories]
-
-        # Get the current category (defaulting to first category)
-        current_category = categories_returned[0] if categories_returned else None
-
-        response = {
-            'success': True,
-            'questions': questions_paginated,
-            'total_questions': len(questions),
-            'categories': categories_returned,
-            'current_category': current_category
-        }
-
-        return jsonify(response)
+        return jsonify(questions_body(page, len(questions), categories))
 
 
 
@@ -125,7 +486,9 @@ def create_app(test_config=None):
             abort(404)
 
         try:
+            scopes = question_scopes(question.category)
             question.delete()
+            cache.committed(*scopes)
             total_questions = Question.query.count()
 
             return jsonify({
@@ -159,6 +522,23 @@ def create_app(test_config=None):
         if not (new_question and new_answer and new_category and new_difficulty):
             abort(422)
 
+        if writer:
+            try:
+                question_id = writer.submit(
+                    question=new_question,
+                    answer=new_answer,
+                    category=new_category,
+                    difficulty=new_difficulty
+                )
+
+                return jsonify({
+                    'success': True,
+                    'created': question_id,
+                    'total_questions': Question.query.count() + writer.unflushed
+                })
+            except:
+                abort(422)
+
         try:
             question = Question(
                 question=new_question,
@@ -168,6 +548,7 @@ def create_app(test_config=None):
             )
 
             question.insert()
+            cache.committed(*question_scopes(question.category))
             total_questions = Question.query.all()
 
             return jsonify({
@@ -194,15 +575,9 @@ def create_app(test_config=None):
         search_term = request.get_json().get('searchTerm', '')
 
         try:
-            questions = Question.query.filter(Question.question.ilike(f'%{search_term}%')).all()
-
-            paginated_questions = paginate_questions(request, questions)
+            questions = Question.query.filter(question_search(search_term)).all()
 
-            return jsonify({
-                "success": True,
-                "questions": paginated_questions,
-                "total_questions": len(questions)
-            })
+            return jsonify(search_body(page_of(request, questions), len(questions)))
         except:
             abort(404)
 
@@ -216,6 +591,14 @@ def create_app(test_config=None):
     """
     @app.route('/categories/<int:category_id>/questions', methods=['GET'])
     def category_questions(category_id):
+        response = cached_page(
+            f'category:{category_id}',
+            (f'questions:{category_id}', 'categories'),
+            lambda: build_category_pages(category_id)
+        )
+        if response:
+            return response
+
         try:
             category = Category.query.get(category_id)
             if not category:
@@ -223,21 +606,9 @@ def create_app(test_config=None):
 
             selection = Question.query.filter_by(category=str(category_id)).all()
 
-            if not selection:
-                return jsonify({
-                    "success": True,
-                    "message": "No questions found for this category",
-                    "current_category": category.type
-                })
-
-            paginated_questions = paginate_questions(request, selection)
-
-            return jsonify({
-                "success": True,
-                "questions": paginated_questions,
-                "total_questions": len(selection),
-                "current_category": category.type
-            })
+            return jsonify(category_questions_body(
+                category.type, page_of(request, selection), len(selection)
+            ))
         except Exception as e:
             print(e)
             abort(404)
@@ -255,50 +626,37 @@ def create_app(test_config=None):
     """
     @app.route('/quizzes', methods=['POST'])
     def start_trivia():
-        body = request.get_json()
-
-        if not body or 'previous_questions' not in body:
-            abort(400, {'message': 'Please provide a JSON body with previous question Ids and optional category.'})
-                    
-        previous_questions = body.get('previous_questions', [])
-        current_category = body.get('quiz_category', None)
-
-        # Filtering questions based on category and previous questions
-        if current_category and current_category['id'] != 0:
-            questions_query = Question.query.filter_by(category=str(current_category['id']))
+        previous_questions, category_id = quiz_request(request.get_json())
+
+        # Filtering questions based on category and previous questions,
+        # from the cached question ids of the category
+        if category_id is not None:
+            category = str(category_id)
+            # only known categories get a cache entry, so client input
+            # cannot grow the cache; any other id has no questions
+            categories = cache.get('categories', ('categories',), load_categories)
+            if category in (str(id) for id, _ in categories):
+                question_ids = cache.get(
+                    f'quiz:{category}', question_scopes(category),
+                    lambda: [id for id, in db.session.query(Question.id).filter_by(category=category)]
+                )
+            else:
+                question_ids = []
         else:
-            questions_query = Question.query
-
-        if previous_questions:
-            questions_query = questions_query.filter(Question.id.notin_(previous_questions))
-
-        questions_raw = questions_query.all()
+            question_ids = cache.get(
+                'quiz', ('questions',),
+                lambda: [id for id, in db.session.query(Question.id)]
+            )
 
-        random_question = random.choice(questions_raw).format() if questions_raw else None
+        previous_questions = set(previous_questions)
+        candidates = [id for id in question_ids if id not in previous_questions]
 
-        return jsonify({
-            'success': True,
-            'question': random_question
-        })
+        # the cached ids can trail another worker's delete by one check interval
+        random_question = None
+        while candidates and not random_question:
+            random_question = Question.query.get(candidates.pop(random.randrange(len(candidates))))
 
-    """
-    @DONE:
-    Create error handlers for all expected errors
-    including 404 and 422.
-    """
-    @app.errorhandler(404)
-    def not_found(error):
-        return( 
-            jsonify({'success': False, 'error': 404,'message': 'resource not found'}),
-            404
-        )
-    
-    @app.errorhandler(422)
-    def unprocessed(error):
-        return(
-            jsonify({'success': False, 'error': 422,'message': 'request cannot be processed'}),
-            422
-        )
+        return jsonify(quiz_body(random_question))
 
 
     return app
@@ -0,0 +1,128 @@
+import math
+import threading
+import time
+
+from flask import jsonify, request
+
+
+"""
+TokenBucket
+    refills rate tokens a second up to burst; take() returns 0 when a token
+    was taken, otherwise the seconds until the next one
+"""
+class TokenBucket:
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+
+class _Route:
+
+    def __init__(self, concurrency=None, rate=None, burst=None):
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.in_flight = 0
+        self.admitted = 0
+        self.rate_limited = 0
+        self.overloaded = 0
+
+    def stats(self):
+        return {
+            'concurrency': self.concurrency,
+            'rate': self.bucket.rate if self.bucket else None,
+            'in_flight': self.in_flight,
+            'admitted': self.admitted,
+            'shed_429': self.rate_limited,
+            'shed_503': self.overloaded,
+        }
+
+
+"""
+AdmissionControl(app, limits, expensive_concurrency)
+    sheds requests to the endpoints in limits instead of letting them queue
+    for database connections. limits maps endpoint names to
+    {'concurrency': n, 'rate': per second, 'burst': n}, any of which may be
+    left out.
+
+    A request over its rate is answered 429, one over its route's
+    concurrency (or over expensive_concurrency, the in-flight total across
+    all limited routes) 503, both with Retry-After. Routes not in limits,
+    such as /categories, are never held back, and expensive_concurrency
+    keeps the rest of the pool free for them.
+"""
+class AdmissionControl:
+
+    def __init__(self, app, limits, expensive_concurrency=None):
+        self.routes = {endpoint: _Route(**limit) for endpoint, limit in limits.items()}
+        self.expensive_concurrency = expensive_concurrency
+        self.expensive_in_flight = 0
+        self._lock = threading.Lock()
+
+        app.before_request(self._admit)
+        app.teardown_request(self._release)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'expensive_concurrency': self.expensive_concurrency,
+                'expensive_in_flight': self.expensive_in_flight,
+                'routes': {endpoint: route.stats() for endpoint, route in self.routes.items()},
+            }
+
+    def _admit(self):
+        # a CORS preflight runs no handler, so it spends no tokens or slots
+        if request.method == 'OPTIONS':
+            return None
+
+        route = self.routes.get(request.endpoint)
+        if not route:
+            return None
+
+        if route.bucket:
+            wait = route.bucket.take()
+            if wait:
+                with self._lock:
+                    route.rate_limited += 1
+                return self._shed(429, 'too many requests', wait)
+
+        with self._lock:
+            if ((route.concurrency is not None and route.in_flight >= route.concurrency)
+                    or (self.expensive_concurrency is not None
+                        and self.expensive_in_flight >= self.expensive_concurrency)):
+                route.overloaded += 1
+                return self._shed(503, 'server busy', 1)
+            route.in_flight += 1
+            route.admitted += 1
+            self.expensive_in_flight += 1
+
+        request.environ['trivia.admitted_route'] = route
+        return None
+
+    def _release(self, error=None):
+        # kept on the request, not g: /batch runs sub-requests inside its app context
+        route = request.environ.pop('trivia.admitted_route', None)
+        if route:
+            with self._lock:
+                route.in_flight -= 1
+                self.expensive_in_flight -= 1
+
+    @staticmethod
+    def _shed(status, message, retry_after):
+        response = jsonify({'success': False, 'error': status, 'message': message})
+        response.status_code = status
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
@@ -0,0 +1,337 @@
+"""
+Async (ASGI) serving path for the trivia API.
+
+create_async_app() returns an ASGI application with the same routes and
+JSON responses as create_app(), but every database call is awaited on an
+async driver (asyncpg on Postgres, aiosqlite on SQLite) through an async
+connection pool. A request waiting on the database holds no thread, so one
+process can keep hundreds of quiz sessions in flight:
+
+    uvicorn flaskr.asgi:create_async_app --factory --port 5000
+
+Only the core routes are served here; write-behind inserts, snapshots,
+admission control and the /admin routes remain on the Flask app. Only the
+awaited queries are written out again: routes are matched with werkzeug,
+as Flask does, and the JSON bodies, error pages and CORS headers are the
+ones create_app() uses.
+"""
+import asyncio
+import json
+import logging
+import random
+from urllib.parse import parse_qsl
+
+from sqlalchemy import Integer, func, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException, InternalServerError, MethodNotAllowed, abort
+from werkzeug.routing import Map, Rule
+
+from models import (
+    database_path, db, question_scopes, question_search, version_keys, BUMP_VERSION,
+    DATA_VERSION_CHANNEL, NOTIFY_VERSIONS, Question, Category
+)
+from . import (
+    CORS_HEADERS, ERROR_MESSAGES, page_of, error_body, categories_body, questions_body,
+    search_body, category_questions_body, quiz_body, quiz_request
+)
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DRIVERS = {
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+# the rules of create_app()'s routes, matched the same way Flask matches them
+ROUTES = Map([
+    Rule('/categories', methods=['GET'], endpoint='get_categories'),
+    Rule('/questions', methods=['GET'], endpoint='get_questions'),
+    Rule('/questions', methods=['POST'], endpoint='add_question'),
+    Rule('/questions/<int:question_id>', methods=['DELETE'], endpoint='delete_question'),
+    Rule('/questions/search', methods=['POST'], endpoint='search_questions'),
+    Rule('/categories/<int:category_id>/questions', methods=['GET'], endpoint='category_questions'),
+    Rule('/quizzes', methods=['POST'], endpoint='start_trivia'),
+])
+
+_CORS_HEADERS = [(name.lower().encode(), value.encode()) for name, value in CORS_HEADERS.items()]
+
+
+def async_database_url(url):
+    scheme, sep, rest = url.partition('://')
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+class _Request:
+
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        self.headers = dict(scope['headers'])
+        self.body = body
+
+    def get_json(self):
+        """None unless the body is sent as JSON, like Flask's get_json()."""
+        mimetype = self.headers.get(b'content-type', b'').split(b';')[0].strip()
+        if mimetype != b'application/json' and not mimetype.endswith(b'+json'):
+            return None
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            abort(400)
+
+
+"""
+AsyncTriviaApp
+    the ASGI application; see create_async_app()
+"""
+class AsyncTriviaApp:
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        self._category = str
+        self._ready = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        status, content_type, payload = await self.dispatch(_Request(scope, body))
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', content_type),
+                        (b'content-length', str(len(payload)).encode())] + _CORS_HEADERS,
+        })
+        await send({'type': 'http.response.body', 'body': payload})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def startup(self):
+        """Create missing tables, like setup_db(), and learn the type of
+        questions.category: asyncpg sends typed parameters, so a category
+        id must be an int against trivia.psql's integer column but a str
+        against the VARCHAR column db.create_all() makes."""
+        if self._ready is None:
+            self._ready = asyncio.ensure_future(self._startup())
+        ready = self._ready
+        try:
+            await asyncio.shield(ready)
+        except Exception:
+            # the next request starts up again, instead of every request
+            # re-raising this error until the process is restarted
+            if self._ready is ready:
+                self._ready = None
+            raise
+
+    async def _startup(self):
+        async with self.engine.begin() as connection:
+            await connection.run_sync(db.Model.metadata.create_all)
+            columns = await connection.run_sync(
+                lambda sync: inspect(sync).get_columns('questions')
+            )
+        category = next(c for c in columns if c['name'] == 'category')
+        self._category = int if isinstance(category['type'], Integer) else str
+
+    async def dispatch(self, request):
+        try:
+            endpoint, args = ROUTES.bind('', path_info=request.path).match(method=request.method)
+        except MethodNotAllowed as e:
+            if request.method == 'OPTIONS':
+                return 200, b'text/html; charset=utf-8', b''
+            return self.error(e)
+        except HTTPException as e:
+            return self.error(e)
+
+        try:
+            await self.startup()
+            async with self.Session() as session:
+                data = await getattr(self, endpoint)(request, session, **args)
+        except HTTPException as e:
+            return self.error(e)
+        except Exception:
+            logger.exception('Exception on %s [%s]', request.path, request.method)
+            return self.error(InternalServerError())
+
+        return 200, b'application/json', _dumps(data)
+
+    @staticmethod
+    def error(e):
+        if e.code in ERROR_MESSAGES:
+            return e.code, b'application/json', _dumps(error_body(e.code))
+        # no JSON handler for these in create_app either: Flask's HTML page
+        return e.code, b'text/html; charset=utf-8', e.get_body().encode()
+
+    async def _bump_versions(self, session, *keys):
+        keys = version_keys(*keys)
+        await session.execute(BUMP_VERSION, [{'key': key} for key in keys])
+        if self.engine.dialect.name == 'postgresql':
+            await session.execute(
+                NOTIFY_VERSIONS, {'channel': DATA_VERSION_CHANNEL, 'keys': ' '.join(keys)}
+            )
+
+    async def _count(self, session):
+        return (await session.execute(select(func.count()).select_from(Question))).scalar()
+
+    async def _categories(self, session):
+        return (await session.execute(
+            select(Category.id, Category.type).order_by(Category.id)
+        )).all()
+
+    async def get_categories(self, request, session):
+        categories = await self._categories(session)
+
+        if not categories:
+            abort(404)
+
+        return categories_body(categories)
+
+    async def get_questions(self, request, session):
+        questions = (await session.execute(
+            select(Question).order_by(Question.id)
+        )).scalars().all()
+
+        page = page_of(request, questions)
+
+        if not page:
+            abort(404)
+
+        return questions_body(page, len(questions), await self._categories(session))
+
+    async def delete_question(self, request, session, question_id):
+        question = await session.get(Question, question_id)
+
+        if not question:
+            abort(404)
+
+        try:
+            await session.delete(question)
+            await self._bump_versions(session, *question_scopes(question.category))
+            await session.commit()
+
+            return {
+                'success': True,
+                'deleted': question_id,
+                'total_questions': await self._count(session)
+            }
+        except Exception:
+            abort(422)
+
+    async def add_question(self, request, session):
+        body = request.get_json()
+
+        new_question = body.get('question')
+        new_answer = body.get('answer')
+        new_category = body.get('category')
+        new_difficulty = body.get('difficulty')
+
+        if not (new_question and new_answer and new_category and new_difficulty):
+            abort(422)
+
+        try:
+            question = Question(
+                question=new_question,
+                answer=new_answer,
+                category=self._category(new_category),
+                difficulty=int(new_difficulty)
+            )
+
+            session.add(question)
+            await self._bump_versions(session, *question_scopes(question.category))
+            await session.commit()
+
+            return {
+                'success': True,
+                'created': question.id,
+                'total_questions': await self._count(session)
+            }
+        except Exception:
+            abort(422)
+
+    async def search_questions(self, request, session):
+        search_term = request.get_json().get('searchTerm', '')
+
+        try:
+            questions = (await session.execute(
+                select(Question).filter(question_search(search_term))
+            )).scalars().all()
+
+            return search_body(page_of(request, questions), len(questions))
+        except Exception:
+            abort(404)
+
+    async def category_questions(self, request, session, category_id):
+        category = await session.get(Category, category_id)
+        if not category:
+            abort(404)
+
+        selection = (await session.execute(
+            select(Question).filter_by(category=self._category(category_id))
+        )).scalars().all()
+
+        return category_questions_body(category.type, page_of(request, selection), len(selection))
+
+    async def start_trivia(self, request, session):
+        previous_questions, category_id = quiz_request(request.get_json())
+
+        query = select(Question)
+        if category_id is not None:
+            try:
+                query = query.filter_by(category=self._category(category_id))
+            except (TypeError, ValueError):
+                return quiz_body(None)
+        if previous_questions:
+            query = query.filter(Question.id.notin_(previous_questions))
+
+        questions = (await session.execute(query)).scalars().all()
+
+        return quiz_body(random.choice(questions) if questions else None)
+
+
+def _dumps(data):
+    # byte-for-byte what Flask's jsonify() produces outside debug mode
+    return (json.dumps(data, sort_keys=True, separators=(',', ':')) + '\n').encode()
+
+
+"""
+create_async_app(test_config)
+    builds the ASGI app. Takes SQLALCHEMY_DATABASE_URI (a sync URL is
+    switched to its async driver), ASYNC_POOL_SIZE and ASYNC_MAX_OVERFLOW.
+"""
+def create_async_app(test_config=None):
+    config = {
+        'SQLALCHEMY_DATABASE_URI': database_path,
+        'ASYNC_POOL_SIZE': 20,
+        'ASYNC_MAX_OVERFLOW': 10,
+    }
+    config.update(test_config or {})
+
+    url = async_database_url(config['SQLALCHEMY_DATABASE_URI'])
+    options = {}
+    if not url.startswith('sqlite'):
+        options = {
+            'pool_size': config['ASYNC_POOL_SIZE'],
+            'max_overflow': config['ASYNC_MAX_OVERFLOW'],
+        }
+
+    return AsyncTriviaApp(create_async_engine(url, **options))
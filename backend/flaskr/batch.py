@@ -0,0 +1,88 @@
+from werkzeug.exceptions import HTTPException
+
+METHODS = ('GET', 'POST', 'DELETE')
+
+# POST routes that only read, and so can run alongside other reads
+READ_ENDPOINTS = {'search_questions', 'start_trivia'}
+
+
+"""
+parse_batch(items, max_requests)
+    validates the "requests" list of a POST /batch body and returns
+    (method, path, body) tuples; raises ValueError on anything malformed
+"""
+def parse_batch(items, max_requests):
+    if not isinstance(items, list) or not items or len(items) > max_requests:
+        raise ValueError(f'requests must be a list of 1 to {max_requests} sub-requests')
+
+    parsed = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError('each sub-request must be an object')
+        method = str(item.get('method', 'GET')).upper()
+        path = item.get('path')
+        if method not in METHODS:
+            raise ValueError(f'unsupported method {method}')
+        if not isinstance(path, str) or not path.startswith('/') or path.split('?')[0] == '/batch':
+            raise ValueError(f'invalid path {path!r}')
+        parsed.append((method, path, item.get('body')))
+    return parsed
+
+
+"""
+run_batch(app, requests, executor)
+    runs parsed sub-requests through the app's normal dispatch, hooks and
+    error handlers included, and returns [{'status', 'body'}] in order.
+
+    Consecutive reads run concurrently on executor, each in its own request
+    context and so with its own pooled connection (one DBAPI connection
+    cannot run two statements at once). A write waits for the reads before
+    it and runs alone in the calling request's context, sharing its session,
+    so later sub-requests see its effect.
+"""
+def run_batch(app, requests, executor):
+    adapter = app.url_map.bind('localhost')
+    results = [None] * len(requests)
+    reads = []
+
+    def run_reads():
+        if len(reads) == 1:
+            index, request = reads[0]
+            results[index] = dispatch(app, *request)
+        else:
+            for (index, _), result in zip(reads, executor.map(
+                    lambda read: dispatch(app, *read[1]), reads)):
+                results[index] = result
+        reads.clear()
+
+    for index, request in enumerate(requests):
+        if is_read(adapter, *request[:2]):
+            reads.append((index, request))
+            continue
+        if reads:
+            run_reads()
+        results[index] = dispatch(app, *request)
+    if reads:
+        run_reads()
+
+    return results
+
+
+def is_read(adapter, method, path):
+    if method == 'GET':
+        return True
+    try:
+        endpoint, _ = adapter.match(path.split('?')[0], method)
+    except HTTPException:
+        return True  # answered 404/405 without touching the database
+    return endpoint in READ_ENDPOINTS
+
+
+def dispatch(app, method, path, body):
+    with app.test_request_context(path, method=method, json=body):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            app.log_exception(e)
+            return {'status': 500, 'body': None}
+        return {'status': response.status_code, 'body': response.get_json(silent=True)}
@@ -0,0 +1,146 @@
+import select
+import threading
+import time
+
+from sqlalchemy import text
+
+from models import db, version_keys, DATA_VERSION_CHANNEL
+
+
+"""
+VersionedCache
+    in-process cache whose entries are tied to data_versions keys
+    ("scopes"). Every worker keeps its own entries; when any worker commits
+    a change it bumps the scopes it touched (models.bump_versions), and the
+    others notice on their next check and drop the entries built from the
+    old versions.
+
+    A check reads the single '*' row, and at most once every
+    check_interval milliseconds; only when that has moved is the whole
+    (small) data_versions table read. With listen=True on Postgres, a
+    background LISTEN connection forces the next check as soon as a change
+    is committed.
+
+    Listeners registered with on_change() hear of every change this worker
+    sees: from check(), and straight away from committed() for changes
+    this worker made itself.
+"""
+class VersionedCache:
+
+    def __init__(self, app, check_interval=100, listen=False):
+        self.app = app
+        self.check_interval = check_interval / 1000
+        self.checks = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = {}
+        self._versions = {}
+        self._checked = float('-inf')
+        self._lock = threading.Lock()
+        self._listeners = []
+
+        if listen:
+            self._listener = threading.Thread(
+                target=self._listen, name='data-version-listener', daemon=True
+            )
+            self._listener.start()
+
+    def get(self, key, scopes, compute):
+        """Return the cached value for key, calling compute() to build it
+        if it is missing or any of its scopes has changed since."""
+        self.check()
+
+        with self._lock:
+            versions = tuple(self._versions.get(scope, 0) for scope in scopes)
+            entry = self._entries.get(key)
+            if entry and entry[1] == versions:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # versions were read before compute(), so a change committed while
+        # computing leaves this entry stale for the next check to drop
+        value = compute()
+        with self._lock:
+            self._entries[key] = (value, versions, scopes)
+        return value
+
+    def versions(self, scopes):
+        """The data_versions of scopes as of the last check."""
+        with self._lock:
+            return tuple(self._versions.get(scope, 0) for scope in scopes)
+
+    def on_change(self, listener):
+        """Call listener(keys, committed_here) with the set of data_versions
+        keys that changed; committed_here is True when called from
+        committed()."""
+        self._listeners.append(listener)
+
+    def committed(self, *keys):
+        """Tell the cache this worker has just committed a change bumping
+        keys, so the next get() re-reads data_versions."""
+        self.expire()
+        self._notify(set(version_keys(*keys)), True)
+
+    def expire(self):
+        """Make the next get() check data_versions regardless of the interval."""
+        self._checked = float('-inf')
+
+    def check(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        self.checks += 1
+
+        latest = db.session.execute(
+            text("SELECT version FROM data_versions WHERE key = '*'")
+        ).scalar() or 0
+        if latest == self._versions.get('*', 0):
+            return
+
+        versions = dict(db.session.execute(text('SELECT key, version FROM data_versions')).all())
+        with self._lock:
+            changed = {
+                key for key in versions.keys() | self._versions.keys()
+                if versions.get(key, 0) != self._versions.get(key, 0)
+            }
+            self._versions = versions
+            self._entries = {
+                key: entry for key, entry in self._entries.items()
+                if entry[1] == tuple(versions.get(scope, 0) for scope in entry[2])
+            }
+        self._notify(changed, False)
+
+    def _notify(self, keys, committed_here):
+        for listener in self._listeners:
+            listener(keys, committed_here)
+
+    def _listen(self):
+        with self.app.app_context():
+            engine = db.engine
+        if engine.dialect.name != 'postgresql':
+            self.app.logger.warning('DATA_VERSION_LISTEN needs Postgres; polling only')
+            return
+
+        while True:
+            try:
+                connection = engine.raw_connection()
+                try:
+                    raw = connection.connection
+                    raw.set_isolation_level(0)  # autocommit
+                    raw.cursor().execute(f'LISTEN {DATA_VERSION_CHANNEL}')
+                    while True:
+                        if select.select([raw], [], [], 60) != ([], [], []):
+                            raw.poll()
+                            if raw.notifies:
+                                raw.notifies.clear()
+                                self.expire()
+                finally:
+                    # never hand a LISTENing autocommit connection back to the pool
+                    connection.invalidate()
+            except Exception:
+                self.app.logger.exception('data version listener failed; reconnecting')
+                self.expire()
+                time.sleep(1)
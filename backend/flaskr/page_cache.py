@@ -0,0 +1,213 @@
+import collections
+import queue
+import threading
+import weakref
+
+
+_Listing = collections.namedtuple('_Listing', 'versions bodies size scopes build')
+
+_POLL = object()
+
+
+"""
+pages_of(selection, count, per_page)
+    the first count pages of selection, an empty list for each page past
+    its end
+"""
+def pages_of(selection, count, per_page):
+    return [selection[start:start + per_page] for start in range(0, count * per_page, per_page)]
+
+
+"""
+PageCache(app, cache, pages, max_bytes)
+    the serialised JSON bodies of the first pages of each question listing
+    (/questions, /categories/<id>/questions), kept in least-recently-used
+    order up to max_bytes in total.
+
+    Listings are versioned against the same data_versions scopes as cache,
+    a VersionedCache, and rebuilt by a background thread as soon as cache
+    reports a change to one of their scopes, so readers never run the
+    query and format() calls of a changed listing; only the first read of
+    a listing builds it inline. The thread also runs cache.check() every
+    check_interval (at least 100 ms) while anything is cached, so changes
+    from other workers are picked up even when nothing else reads.
+
+    Until its rebuild lands, a changed listing is served stale. Readers of
+    a listing changed by this worker first wait up to rebuild_wait
+    milliseconds for the rebuild already scheduled, so the read that
+    follows a write normally sees it.
+"""
+class PageCache:
+
+    def __init__(self, app, cache, pages=3, max_bytes=8 * 1024 * 1024, rebuild_wait=250):
+        self.app = app
+        self.cache = cache
+        self.pages = pages
+        self.max_bytes = max_bytes
+        self.rebuild_wait = rebuild_wait / 1000
+        self.size = 0
+        self.hits = 0
+        self.stale = 0
+        self.misses = 0
+        self.rebuilds = 0
+
+        self._listings = collections.OrderedDict()
+        self._queue = queue.Queue()
+        self._pending = set()
+        # set when the rebuild of a listing changed by this worker is stored
+        self._rebuilt = {}
+        # bumped when this worker commits a change: builds started before
+        # it may have read the old rows, and are not stored
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._rebuilder = None
+
+        cache.on_change(self._changed)
+
+    def get(self, listing, page, scopes, build):
+        """Return the cached body of page of listing, or None if the page
+        is not cached. build() returns the bodies of the first self.pages
+        pages (None for a page past the end), or None if listing does not
+        exist."""
+        if not 1 <= page <= self.pages:
+            return None
+
+        self.cache.check()
+        versions = self.cache.versions(scopes)
+
+        with self._lock:
+            entry = self._listings.get(listing)
+            if entry:
+                self._listings.move_to_end(listing)
+                if entry.versions == versions:
+                    self.hits += 1
+                    return entry.bodies[page - 1]
+                self._schedule(listing, scopes, build)
+                rebuilt = self._rebuilt.get(listing)
+            else:
+                self.misses += 1
+                generation = self._generation
+
+        if not entry:
+            bodies = build()
+            self._store(listing, scopes, build, versions, bodies, generation)
+            return bodies[page - 1] if bodies else None
+
+        if rebuilt and rebuilt.wait(self.rebuild_wait):
+            with self._lock:
+                self.hits += 1
+                entry = self._listings.get(listing)
+            # gone if the listing no longer exists, or was evicted
+            return entry.bodies[page - 1] if entry else None
+
+        with self._lock:
+            self.stale += 1
+        return entry.bodies[page - 1]
+
+    def wait(self):
+        """Block until every scheduled rebuild has finished."""
+        self._queue.join()
+
+    def _changed(self, keys, committed_here):
+        with self._lock:
+            if committed_here:
+                self._generation += 1
+            for listing, entry in self._listings.items():
+                if keys.isdisjoint(entry.scopes):
+                    continue
+                if committed_here and listing not in self._rebuilt:
+                    self._rebuilt[listing] = threading.Event()
+                self._schedule(listing, entry.scopes, entry.build)
+
+    def _schedule(self, listing, scopes, build):
+        # called holding self._lock
+        if listing in self._pending:
+            return
+        self._pending.add(listing)
+        self._queue.put((listing, scopes, build))
+        self._start()
+
+    def _start(self):
+        # called holding self._lock
+        if not self._rebuilder:
+            self._rebuilder = threading.Thread(
+                target=_rebuild_loop,
+                args=(weakref.ref(self), self._queue, max(self.cache.check_interval, 0.1)),
+                name='page-cache-rebuild',
+                daemon=True
+            )
+            self._rebuilder.start()
+
+    def _run(self, task):
+        if task is _POLL:
+            if self._listings:
+                try:
+                    with self.app.app_context():
+                        self.cache.check()
+                except Exception:
+                    self.app.logger.exception('checking data versions for cached pages failed')
+            return
+
+        listing, scopes, build = task
+        with self._lock:
+            # a change arriving from here on schedules another rebuild
+            self._pending.discard(listing)
+            generation = self._generation
+        try:
+            with self.app.app_context():
+                self.cache.check()
+                versions = self.cache.versions(scopes)
+                bodies = build()
+            self._store(listing, scopes, build, versions, bodies, generation)
+            self.rebuilds += 1
+        except Exception:
+            self.app.logger.exception('rebuilding cached pages of %s failed', listing)
+            with self._lock:
+                # readers waiting on it get the stale bodies
+                self._release(listing)
+        finally:
+            self._queue.task_done()
+
+    def _store(self, listing, scopes, build, versions, bodies, generation):
+        size = sum(len(body) for body in bodies if body) if bodies else 0
+        with self._lock:
+            if generation != self._generation:
+                # read rows from before a change this worker made since;
+                # make sure a rebuild from after it follows
+                if listing in self._rebuilt:
+                    self._schedule(listing, scopes, build)
+                return
+            self._release(listing)
+            old = self._listings.pop(listing, None)
+            if old:
+                self.size -= old.size
+            if not bodies or size > self.max_bytes:
+                return
+
+            self._listings[listing] = _Listing(versions, bodies, size, scopes, build)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self._listings.popitem(last=False)
+                self.size -= evicted.size
+            self._start()
+
+    def _release(self, listing):
+        # called holding self._lock
+        rebuilt = self._rebuilt.pop(listing, None)
+        if rebuilt:
+            rebuilt.set()
+
+
+def _rebuild_loop(ref, tasks, poll_interval):
+    # holds the PageCache only while running a task, so the thread ends
+    # once its app is gone
+    while True:
+        try:
+            task = tasks.get(timeout=poll_interval)
+        except queue.Empty:
+            task = _POLL
+        page_cache = ref()
+        if page_cache is None:
+            return
+        page_cache._run(task)
+        del page_cache
@@ -0,0 +1,112 @@
+import collections
+import datetime
+import json
+import random
+import threading
+import time
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+
+"""
+SlowQueryLog(engine, threshold_ms, explain_sample, size)
+    records every statement on engine that takes threshold_ms or longer,
+    with its bound parameters, duration and the route that ran it, in a
+    ring buffer of the last size entries.
+
+    A explain_sample fraction of slow SELECTs also get their plan captured
+    (EXPLAIN on Postgres, EXPLAIN QUERY PLAN on SQLite) on a separate cursor
+    of the same connection. On Postgres this runs inside a savepoint, so a
+    failed EXPLAIN cannot abort the request's transaction.
+"""
+class SlowQueryLog:
+
+    def __init__(self, engine, threshold_ms=250, explain_sample=0.1, size=200):
+        self.threshold = threshold_ms / 1000
+        self.explain_sample = explain_sample
+        self.dialect = engine.dialect.name
+        self._entries = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+        event.listen(engine, 'handle_error', self._failed)
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries)
+
+    def dump(self, path):
+        """Write the buffered entries to path, one JSON object per line."""
+        entries = self.entries()
+        with open(path, 'w') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+        return len(entries)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slow_query_start', []).append(time.perf_counter())
+
+    def _failed(self, context):
+        # a failed statement never reaches after_cursor_execute
+        if context.connection is not None:
+            starts = context.connection.info.get('slow_query_start')
+            if starts:
+                starts.pop()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['slow_query_start'].pop()
+        if duration < self.threshold:
+            return
+
+        entry = {
+            'time': datetime.datetime.utcnow().isoformat() + 'Z',
+            'duration_ms': round(duration * 1000, 3),
+            'statement': statement,
+            'parameters': _jsonable(parameters),
+            'route': None,
+            'plan': None,
+        }
+        if has_request_context():
+            entry['route'] = f'{request.method} {request.path} ({request.endpoint})'
+        if (not executemany and statement.lstrip()[:6].upper() == 'SELECT'
+                and random.random() < self.explain_sample):
+            entry['plan'] = self._explain(conn, statement, parameters)
+
+        with self._lock:
+            self._entries.append(entry)
+
+    def _explain(self, conn, statement, parameters):
+        cursor = conn.connection.cursor()
+        try:
+            if self.dialect == 'postgresql':
+                cursor.execute('SAVEPOINT slow_query_explain')
+                try:
+                    cursor.execute('EXPLAIN ' + statement, parameters)
+                    plan = [row[0] for row in cursor.fetchall()]
+                except Exception:
+                    cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                    raise
+                finally:
+                    cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+            elif self.dialect == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+                plan = [row[-1] for row in cursor.fetchall()]
+            else:
+                return None
+            return '\n'.join(plan)
+        except Exception as e:
+            return f'EXPLAIN failed: {e}'
+        finally:
+            cursor.close()
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return repr(value)
@@ -0,0 +1,303 @@
+"""
+Read-only question bank snapshots.
+
+A snapshot is a single binary file compiled from the categories and
+questions tables, either from a live database or a pg_dump file such as
+trivia.psql:
+
+    python build_snapshot.py trivia.snap --dump trivia.psql
+    python build_snapshot.py trivia.snap --database postgresql://...
+
+create_app({'SNAPSHOT_PATH': 'trivia.snap'}) then serves the read routes
+from the file without a database connection. The file is opened with mmap,
+so every worker process maps the same page-cache pages instead of holding
+its own copy of the question bank.
+
+Layout (little-endian, every section 4-byte aligned):
+
+    header          HEADER
+    categories      CATEGORY * n_categories, ordered by id
+    questions       QUESTION * n_questions, ordered by id
+    index           uint32 question positions, one run per category
+    lower_offsets   uint32 * (n_questions + 1), start of each lowered question
+    strings         utf-8 question, answer and category text
+    lower           lowered question text, NUL separated, for search
+"""
+import bisect
+import mmap
+import os
+import struct
+
+MAGIC = b'TRIVSNP1'
+HEADER = struct.Struct('<8sIIIIIIII')
+# id, type offset, type length, first index entry, index entry count
+CATEGORY = struct.Struct('<iIIII')
+# id, category (-1 for none), difficulty, question offset, question length,
+# answer offset, answer length
+QUESTION = struct.Struct('<iiiIIII')
+UINT32 = struct.Struct('<I')
+
+NULL = 0xFFFFFFFF
+NO_CATEGORY = -1
+
+
+def _align(buffer):
+    buffer.extend(b'\0' * (-len(buffer) % 4))
+
+
+"""
+read_psql_dump(path)
+    returns {table: [row dict]} for every COPY block in a plain-format
+    pg_dump file. Values are strings, or None for \\N.
+"""
+def read_psql_dump(path):
+    tables = {}
+    rows = columns = None
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if rows is None:
+                if line.startswith('COPY '):
+                    head, _, rest = line[len('COPY '):].partition(' (')
+                    columns = [c.strip() for c in rest.split(')')[0].split(',')]
+                    rows = tables.setdefault(head.split('.')[-1], [])
+                continue
+            if line == '\\.':
+                rows = None
+                continue
+            rows.append(dict(zip(columns, [_unescape(v) for v in line.split('\t')])))
+
+    return tables
+
+
+def _unescape(value):
+    if value == '\\N':
+        return None
+    if '\\' not in value:
+        return value
+    escapes = {'t': '\t', 'n': '\n', 'r': '\r', '\\': '\\'}
+    out, chars = [], iter(value)
+    for char in chars:
+        if char == '\\':
+            char = next(chars, '')
+            char = escapes.get(char, char)
+        out.append(char)
+    return ''.join(out)
+
+
+"""
+read_database(database_path)
+    returns the categories and questions tables of a live database in the
+    same shape as read_psql_dump().
+"""
+def read_database(database_path):
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(database_path)
+    with engine.connect() as connection:
+        return {
+            table: [dict(row._mapping) for row in connection.execute(
+                text(f'SELECT * FROM {table} ORDER BY id')
+            )]
+            for table in ('categories', 'questions')
+        }
+
+
+def _int(value, default=None):
+    return default if value is None else int(value)
+
+
+"""
+write_snapshot(path, tables)
+    compiles {'categories': [...], 'questions': [...]} rows into a snapshot
+    file. The file is written next to path and renamed into place, so
+    running servers keep the snapshot they mapped.
+"""
+def write_snapshot(path, tables):
+    categories = sorted(tables['categories'], key=lambda row: int(row['id']))
+    questions = sorted(tables['questions'], key=lambda row: int(row['id']))
+
+    strings = bytearray()
+
+    def string(value):
+        if value is None:
+            return 0, NULL
+        data = str(value).encode('utf-8')
+        offset = len(strings)
+        strings.extend(data)
+        return offset, len(data)
+
+    question_records = bytearray()
+    lower = bytearray()
+    lower_offsets = bytearray()
+    positions = {}
+    for position, row in enumerate(questions):
+        category = _int(row['category'], NO_CATEGORY)
+        positions.setdefault(category, []).append(position)
+        question_records += QUESTION.pack(
+            int(row['id']),
+            category,
+            _int(row['difficulty'], 0),
+            *string(row['question']),
+            *string(row['answer'])
+        )
+        lower_offsets += UINT32.pack(len(lower))
+        lower.extend((row['question'] or '').lower().encode('utf-8') + b'\0')
+    lower_offsets += UINT32.pack(len(lower))
+
+    category_records = bytearray()
+    index = bytearray()
+    for row in categories:
+        members = positions.get(int(row['id']), [])
+        category_records += CATEGORY.pack(
+            int(row['id']), *string(row['type']), len(index) // 4, len(members)
+        )
+        index += struct.pack(f'<{len(members)}I', *members)
+
+    sections = [category_records, question_records, index, lower_offsets, strings, lower]
+    offsets = []
+    body = bytearray(HEADER.size)
+    _align(body)
+    for section in sections:
+        offsets.append(len(body))
+        body += section
+        _align(body)
+    HEADER.pack_into(body, 0, MAGIC, len(categories), len(questions), *offsets)
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+
+
+"""
+SnapshotQuestion
+    a question row read from a snapshot; format() matches Question.format()
+"""
+class SnapshotQuestion:
+
+    def __init__(self, snapshot, position):
+        (self.id, category, self.difficulty,
+         question_offset, question_length,
+         answer_offset, answer_length) = snapshot._question(position)
+        self.category = None if category == NO_CATEGORY else category
+        self.question = snapshot._string(question_offset, question_length)
+        self.answer = snapshot._string(answer_offset, answer_length)
+
+    def format(self):
+        return {
+            'id': self.id,
+            'question': self.question,
+            'answer': self.answer,
+            'category': self.category,
+            'difficulty': self.difficulty
+            }
+
+
+"""
+QuestionList
+    a lazy sequence of questions over a run of positions; only the rows
+    that are indexed or sliced out are decoded
+"""
+class QuestionList:
+
+    def __init__(self, snapshot, positions):
+        self.snapshot = snapshot
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [SnapshotQuestion(self.snapshot, p) for p in self.positions[item]]
+        return SnapshotQuestion(self.snapshot, self.positions[item])
+
+    def excluding(self, ids):
+        """Return the questions whose id is not in ids."""
+        ids = set(ids)
+        return QuestionList(self.snapshot, [
+            p for p in self.positions if self.snapshot._question(p)[0] not in ids
+        ])
+
+
+"""
+Snapshot(path)
+    memory-mapped, read-only view of a snapshot file
+"""
+class Snapshot:
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, self.category_count, self.question_count,
+         self._categories_offset, self._questions_offset, index_offset,
+         lower_offsets_offset, self._strings_offset,
+         self._lower_offset) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a trivia snapshot')
+
+        view = memoryview(self._mm)
+        self._index = view[index_offset:lower_offsets_offset].cast('I')
+        self._lower_offsets = view[
+            lower_offsets_offset:lower_offsets_offset + 4 * (self.question_count + 1)
+        ].cast('I')
+
+    def _question(self, position):
+        return QUESTION.unpack_from(
+            self._mm, self._questions_offset + position * QUESTION.size
+        )
+
+    def _category(self, position):
+        return CATEGORY.unpack_from(
+            self._mm, self._categories_offset + position * CATEGORY.size
+        )
+
+    def _string(self, offset, length):
+        if length == NULL:
+            return None
+        start = self._strings_offset + offset
+        return self._mm[start:start + length].decode('utf-8')
+
+    def categories(self):
+        """Return [(id, type)] ordered by id."""
+        return [
+            (category_id, self._string(offset, length))
+            for category_id, offset, length, _, _ in map(
+                self._category, range(self.category_count)
+            )
+        ]
+
+    def category(self, category_id):
+        """Return (type, QuestionList) for a category id, or None."""
+        ids = [self._category(p)[0] for p in range(self.category_count)]
+        position = bisect.bisect_left(ids, category_id)
+        if position == len(ids) or ids[position] != category_id:
+            return None
+        _, offset, length, start, count = self._category(position)
+        return self._string(offset, length), QuestionList(self, self._index[start:start + count])
+
+    def questions(self):
+        """Return every question, ordered by id."""
+        return QuestionList(self, range(self.question_count))
+
+    def search(self, term):
+        """Return the questions containing term, case-insensitively, by id."""
+        needle = term.lower().encode('utf-8')
+        if not needle:
+            return self.questions()
+
+        start = self._lower_offset
+        end = start + self._lower_offsets[self.question_count]
+        positions = []
+        hit = self._mm.find(needle, start, end)
+        while hit != -1:
+            position = bisect.bisect_right(self._lower_offsets, hit - start) - 1
+            question_end = start + self._lower_offsets[position + 1] - 1
+            if hit + len(needle) <= question_end:
+                positions.append(position)
+            hit = self._mm.find(needle, question_end + 1, end)
+
+        return QuestionList(self, positions)
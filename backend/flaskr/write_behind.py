@@ -0,0 +1,218 @@
+import atexit
+import collections
+import queue
+import threading
+import time
+
+from sqlalchemy import text
+
+from models import db, question_scopes, Question
+
+SYNC = 'sync'
+BATCHED = 'batched'
+
+# WRITE_BEHIND_DURABILITY
+#   'flush' - a POST is acknowledged once the batch holding it is committed
+#             (group commit: one fsync per batch instead of one per question)
+#   'async' - a POST is acknowledged as soon as it is queued; questions still
+#             in the queue are lost if the process dies without shutting down
+DURABILITY_FLUSH = 'flush'
+DURABILITY_ASYNC = 'async'
+
+_STOP = object()
+
+
+"""
+IdAllocator
+    hands out question ids from a block reserved up front, so a queued
+    question has its id before it is written.
+    On Postgres the block is drawn from questions_id_seq; elsewhere it is
+    counted on from max(id), which is only safe with a single writer process.
+"""
+class IdAllocator:
+
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self._ids = collections.deque()
+        self._high = 0
+        self._lock = threading.Lock()
+
+    def allocate(self):
+        with self._lock:
+            if not self._ids:
+                self._ids.extend(self._reserve())
+            return self._ids.popleft()
+
+    def _reserve(self):
+        if db.engine.dialect.name == 'postgresql':
+            rows = db.session.execute(
+                text("SELECT nextval('questions_id_seq') FROM generate_series(1, :n)"),
+                {'n': self.block_size}
+            )
+            return [row[0] for row in rows]
+
+        current = db.session.execute(text('SELECT max(id) FROM questions')).scalar() or 0
+        start = max(current, self._high) + 1
+        self._high = start + self.block_size - 1
+        return range(start, self._high + 1)
+
+
+class _Pending:
+
+    def __init__(self, question):
+        self.question = question
+        self.error = None
+        self.done = threading.Event()
+
+
+"""
+QuestionWriter
+    write-behind queue for new questions. submit() validates a question,
+    assigns it an id and queues it; a background thread commits the queue
+    in batches of batch_size, or every flush_interval seconds, whichever
+    comes first ('flush' durability commits as soon as the previous batch
+    is done). close() drains the queue and is registered with atexit.
+"""
+class QuestionWriter:
+
+    def __init__(self, app, batch_size=100, flush_interval=0.05,
+                 durability=DURABILITY_FLUSH, id_block=100):
+        if durability not in (DURABILITY_FLUSH, DURABILITY_ASYNC):
+            raise ValueError(f'unknown write-behind durability {durability!r}')
+
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.ids = IdAllocator(id_block)
+
+        self.unflushed = 0
+        self.batches = 0
+        self.failed = 0
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name='question-writer', daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, question, answer, category, difficulty):
+        """Queue a new question and return its id.
+
+        Takes the same input as Question.insert(); in 'flush' durability
+        mode, re-raises the error if the question fails to insert.
+        """
+        new_question = Question(
+            question=question,
+            answer=answer,
+            category=category,
+            difficulty=difficulty
+        )
+        new_question.id = question_id = self.ids.allocate()
+        pending = _Pending(new_question)
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('question writer is closed')
+            self.unflushed += 1
+            self._queue.put(pending)
+
+        if self.durability == DURABILITY_FLUSH:
+            pending.done.wait()
+            if pending.error:
+                raise pending.error
+
+        return question_id
+
+    def close(self, timeout=None):
+        """Stop accepting questions and wait for the queue to be committed."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            if batch:
+                self._flush(batch)
+
+    def _collect(self):
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+
+        # 'flush' callers are blocked until their batch commits, so lingering
+        # only adds latency: take whatever queued up during the last commit
+        batch = [item]
+        linger = self.flush_interval if self.durability == DURABILITY_ASYNC else 0
+        deadline = time.monotonic() + linger
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+
+        return batch, False
+
+    def _flush(self, batch):
+        with self.app.app_context():
+            try:
+                try:
+                    self._insert(batch)
+                    errors = [None] * len(batch)
+                except Exception as e:
+                    if len(batch) == 1:
+                        errors = [e]
+                    else:
+                        # one bad question fails the group commit: retry
+                        # one by one so only its own POST gets the error
+                        errors = [self._insert_one(pending) for pending in batch]
+            finally:
+                db.session.remove()
+
+        failed = [error for error in errors if error]
+        for error in failed:
+            self.app.logger.error('write-behind insert failed: %s', error)
+
+        with self._lock:
+            self.unflushed -= len(batch)
+            self.batches += 1
+            self.failed += len(failed)
+
+        for pending, error in zip(batch, errors):
+            pending.error = error
+            pending.done.set()
+
+    def _insert_one(self, pending):
+        try:
+            self._insert([pending])
+        except Exception as e:
+            return e
+        return None
+
+    def _insert(self, batch):
+        # read before the commit expires them
+        scopes = [scope for pending in batch for scope in question_scopes(pending.question.category)]
+        try:
+            Question.insert_batch([pending.question for pending in batch])
+        except Exception:
+            db.session.rollback()
+            raise
+
+        cache = self.app.extensions.get('cache')
+        if cache:
+            cache.committed(*scopes)
@@ -0,0 +1,299 @@
+"""
+Replay the frontend's call sequences against the trivia API and report
+throughput, errors and latency percentiles per route.
+
+    python loadtest.py --users 16 --duration 30
+    python loadtest.py --ramp 1,2,4,8,16,32 --duration 10
+    python loadtest.py --url http://127.0.0.1:5000 --mix browse=4,quiz=4,search=1
+
+By default the app runs in-process against a temporary SQLite database
+seeded from trivia.psql; --database points it at another database and
+--config passes create_app() settings (KEY=VALUE, VALUE parsed as JSON
+when it can be). --url drives a running server instead.
+
+Flows (see frontend/src/components):
+    browse      QuestionView mount: categories, questions page 1, then paging
+    category    QuestionView category click
+    search      QuestionView search
+    add_delete  FormView submit, then QuestionView delete and refresh
+    quiz        QuizView: categories, then up to 5 quiz questions
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+SEARCH_TERMS = ['title', 'the', 'who', 'what', 'which', 'is', 'boxer', 'xyzzy']
+QUESTIONS_PER_PLAY = 5
+DEFAULT_MIX = 'browse=4,category=2,search=2,quiz=4,add_delete=1'
+
+
+class Recorder:
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.shed = defaultdict(int)
+        self.elapsed = 0
+        self._lock = threading.Lock()
+
+    def record(self, route, status, seconds):
+        with self._lock:
+            self.latencies[route].append(seconds)
+            if status in (429, 503):
+                self.shed[route] += 1
+            elif status == 0 or status >= 400:
+                self.errors[route] += 1
+
+    def report(self):
+        elapsed = self.elapsed
+        rows = []
+        total = errors = shed = 0
+        for route in sorted(self.latencies):
+            latencies = sorted(self.latencies[route])
+            total += len(latencies)
+            errors += self.errors[route]
+            shed += self.shed[route]
+            rows.append((
+                route, len(latencies), len(latencies) / elapsed,
+                self.errors[route], self.shed[route],
+                *(percentile(latencies, p) * 1000 for p in (50, 90, 99)),
+                latencies[-1] * 1000
+            ))
+
+        lines = [f'{"route":<40}{"count":>8}{"req/s":>9}{"errors":>8}{"shed":>6}'
+                 f'{"p50 ms":>9}{"p90 ms":>9}{"p99 ms":>9}{"max ms":>9}']
+        for row in rows:
+            lines.append('{:<40}{:>8}{:>9.1f}{:>8}{:>6}{:>9.1f}{:>9.1f}{:>9.1f}{:>9.1f}'.format(*row))
+        lines.append(f'{"total":<40}{total:>8}{total / elapsed:>9.1f}{errors:>8}{shed:>6}')
+        return '\n'.join(lines)
+
+    def summary(self):
+        latencies = sorted(l for route in self.latencies.values() for l in route)
+        return (
+            len(latencies),
+            sum(self.errors.values()) + sum(self.shed.values()),
+            percentile(latencies, 99) * 1000 if latencies else 0
+        )
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+"""
+Client
+    one simulated browser: a requests session against --url, or a Flask
+    test client. call() records the request under route, the URL pattern;
+    a request that fails without a response (connection refused or reset,
+    timeout) is recorded as an error with status 0.
+"""
+class Client:
+
+    def __init__(self, recorder, base_url=None, app=None, timeout=10):
+        self.recorder = recorder
+        self.base_url = base_url
+        self.timeout = timeout
+        self.session = requests.Session() if base_url else app.test_client()
+
+    def call(self, route, method, path, body=None):
+        start = time.perf_counter()
+        try:
+            if self.base_url:
+                response = self.session.request(
+                    method, self.base_url + path, json=body, timeout=self.timeout
+                )
+                status, data = response.status_code, _json(response.content)
+            else:
+                response = self.session.open(path, method=method, json=body)
+                status, data = response.status_code, _json(response.data)
+        except Exception:
+            status, data = 0, None
+        self.recorder.record(route, status, time.perf_counter() - start)
+        return data if status == 200 else None
+
+
+def _json(content):
+    try:
+        return json.loads(content)
+    except ValueError:
+        return None
+
+
+def browse(client, rng, categories):
+    data = client.call('GET /categories', 'GET', '/categories')
+    page = client.call('GET /questions', 'GET', '/questions?page=1')
+    if not data or not page:
+        return
+    pages = max(1, -(-page['total_questions'] // 10))
+    for _ in range(rng.randint(0, 3)):
+        client.call('GET /questions', 'GET', f'/questions?page={rng.randint(1, pages)}')
+
+
+def category(client, rng, categories):
+    category_id = rng.choice(list(categories))
+    client.call('GET /categories/<id>/questions', 'GET', f'/categories/{category_id}/questions')
+
+
+def search(client, rng, categories):
+    client.call('POST /questions/search', 'POST', '/questions/search',
+                {'searchTerm': rng.choice(SEARCH_TERMS)})
+
+
+def add_delete(client, rng, categories):
+    client.call('GET /categories', 'GET', '/categories')
+    created = client.call('POST /questions', 'POST', '/questions', {
+        'question': f'Load test question {rng.random()}',
+        'answer': 'Load test answer',
+        'category': rng.choice(list(categories)),
+        'difficulty': rng.randint(1, 5)
+    })
+    if created:
+        client.call('DELETE /questions/<id>', 'DELETE', f'/questions/{created["created"]}')
+        client.call('GET /questions', 'GET', '/questions?page=1')
+
+
+def quiz(client, rng, categories):
+    client.call('GET /categories', 'GET', '/categories')
+    # "All" sends the click event's type, as QuizView.selectCategory does
+    category_id = rng.choice([0] + list(categories))
+    quiz_category = {'id': category_id, 'type': categories.get(category_id, 'click')}
+    previous = []
+    for _ in range(QUESTIONS_PER_PLAY):
+        data = client.call('POST /quizzes', 'POST', '/quizzes', {
+            'previous_questions': previous,
+            'quiz_category': quiz_category
+        })
+        if not data or not data['question']:
+            break
+        previous.append(data['question']['id'])
+
+
+FLOWS = {
+    'browse': browse,
+    'category': category,
+    'search': search,
+    'add_delete': add_delete,
+    'quiz': quiz,
+}
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name not in FLOWS:
+            raise SystemExit(f'unknown flow {name!r}; choose from {", ".join(FLOWS)}')
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def run(make_client, mix, users, duration, seed):
+    """Run users simulated browsers for duration seconds; return the Recorder."""
+    recorder = Recorder()
+    names, weights = list(mix), list(mix.values())
+    deadline = time.monotonic() + duration
+
+    probe = make_client(Recorder()).call('GET /categories', 'GET', '/categories')
+    try:
+        categories = {int(id): type for id, type in probe['categories'].items()}
+    except (TypeError, KeyError, ValueError, AttributeError):
+        categories = {1: ''}
+
+    def user(number):
+        rng = random.Random(seed * 1000 + number)
+        client = make_client(recorder)
+        while time.monotonic() < deadline:
+            flow = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                FLOWS[flow](client, rng, categories)
+            except Exception:
+                # an unexpected response body; keep the user going until the deadline
+                recorder.record(f'{flow} flow', 0, time.perf_counter() - start)
+
+    threads = [threading.Thread(target=user, args=(n,)) for n in range(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    recorder.elapsed = time.perf_counter() - start
+    return recorder
+
+
+def in_process_app(database, config):
+    from flaskr import create_app
+    from flaskr.snapshot import read_psql_dump
+    from models import seed_db, Question
+
+    app = create_app(dict(config, SQLALCHEMY_DATABASE_URI=database))
+    with app.app_context():
+        if not Question.query.count():
+            seed_db(read_psql_dump(os.path.join(os.path.dirname(__file__), 'trivia.psql')))
+    return app
+
+
+def parse_config(pairs):
+    config = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        try:
+            config[key] = json.loads(value)
+        except ValueError:
+            config[key] = value
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', help='base URL of a running server')
+    target.add_argument('--database', help='database URL for the in-process app')
+    parser.add_argument('--config', action='append', default=[], metavar='KEY=VALUE',
+                        help='create_app() setting for the in-process app')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'flow weights (default: {DEFAULT_MIX})')
+    parser.add_argument('--users', type=int, default=8, help='concurrent simulated browsers')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per run')
+    parser.add_argument('--ramp', help='comma-separated user counts to step through')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=10, help='seconds per request against --url')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.url:
+            def make_client(recorder):
+                return Client(recorder, base_url=args.url.rstrip('/'), timeout=args.timeout)
+        else:
+            app = in_process_app(
+                args.database or 'sqlite:///' + os.path.join(tmp, 'loadtest.db'),
+                parse_config(args.config)
+            )
+
+            def make_client(recorder):
+                return Client(recorder, app=app)
+
+        if not args.ramp:
+            recorder = run(make_client, mix, args.users, args.duration, args.seed)
+            print(recorder.report())
+            return
+
+        # throughput stops growing and p99 climbs past the saturation point
+        print(f'{"users":>6}{"req/s":>9}{"failed":>8}{"p99 ms":>9}')
+        for users in (int(n) for n in args.ramp.split(',')):
+            recorder = run(make_client, mix, users, args.duration, args.seed)
+            total, failed, p99 = recorder.summary()
+            print(f'{users:>6}{total / recorder.elapsed:>9.1f}{failed:>8}{p99:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 from dotenv import load_dotenv
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, create_engine, text
 from flask_sqlalchemy import SQLAlchemy
 
 load_dotenv()
@@ -19,6 +19,71 @@ def setup_db(app, database_path=database_path):
     db.init_app(app)
     db.create_all()
 
+"""
+seed_db(tables)
+    inserts the categories and questions rows of a dump, as returned by
+    flaskr.snapshot.read_psql_dump(), into empty tables. The rows keep their
+    ids, so on Postgres the id sequences are moved past them afterwards.
+"""
+def seed_db(tables):
+    db.session.execute(Category.__table__.insert(), tables['categories'])
+    db.session.execute(Question.__table__.insert(), tables['questions'])
+    if db.engine.dialect.name == 'postgresql':
+        for table in ('categories', 'questions'):
+            db.session.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT max(id) FROM {table}))"
+            ))
+    db.session.commit()
+
+"""
+bump_versions(*keys)
+    increments the data_versions rows for keys, and the '*' row every
+    change bumps, in the current transaction. Callers commit. On Postgres
+    the keys are also sent with NOTIFY on channel DATA_VERSION_CHANNEL when
+    the transaction commits.
+"""
+DATA_VERSION_CHANNEL = 'trivia_data_version'
+BUMP_VERSION = text(
+    'INSERT INTO data_versions (key, version) VALUES (:key, 1) '
+    'ON CONFLICT (key) DO UPDATE SET version = data_versions.version + 1'
+)
+NOTIFY_VERSIONS = text('SELECT pg_notify(:channel, :keys)')
+
+def version_keys(*keys):
+    return ('*',) + tuple(dict.fromkeys(keys))
+
+def bump_versions(*keys):
+    keys = version_keys(*keys)
+    db.session.execute(BUMP_VERSION, [{'key': key} for key in keys])
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(
+            NOTIFY_VERSIONS, {'channel': DATA_VERSION_CHANNEL, 'keys': ' '.join(keys)}
+        )
+
+"""
+question_scopes(category)
+    the data_versions keys a change to a question in category bumps
+"""
+def question_scopes(category):
+    return ('questions', f'questions:{category}')
+
+"""
+search_pattern(term)
+    the LIKE pattern, with escape character '\\', matching questions that
+    contain term literally: % and _ in a search term are not wildcards
+"""
+def search_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+"""
+question_search(term)
+    the filter matching questions that contain term, ignoring case
+"""
+def question_search(term):
+    return Question.question.ilike(search_pattern(term), escape='\\')
+
 """
 Question
 
@@ -40,13 +105,24 @@ class Question(db.Model):
 
     def insert(self):
         db.session.add(self)
+        bump_versions(*question_scopes(self.category))
+        db.session.commit()
+
+    @staticmethod
+    def insert_batch(questions):
+        db.session.add_all(questions)
+        bump_versions(*[
+            scope for question in questions for scope in question_scopes(question.category)
+        ])
         db.session.commit()
 
     def update(self):
+        bump_versions(*question_scopes(self.category))
         db.session.commit()
 
     def delete(self):
         db.session.delete(self)
+        bump_versions(*question_scopes(self.category))
         db.session.commit()
 
     def format(self):
@@ -76,3 +152,14 @@ class Category(db.Model):
             'id': self.id,
             'type': self.type
             }
+
+"""
+DataVersion
+    one counter per cached entity, bumped in the same transaction as every
+    change to it, so each worker can tell when its cache is stale
+"""
+class DataVersion(db.Model):
+    __tablename__ = 'data_versions'
+
+    key = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False)
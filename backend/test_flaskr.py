@@ -1,33 +1,67 @@
 from dotenv import load_dotenv
+import asyncio
+import atexit
+import json
 import os
-import requests
+import shutil
+import tempfile
+import threading
 import unittest
-from flask_sqlalchemy import SQLAlchemy
 
+from flask import Flask
+
+import loadtest
 from flaskr import create_app
+from flaskr.asgi import create_async_app
+from flaskr.snapshot import read_psql_dump, write_snapshot
+from models import setup_db, seed_db, Question, DataVersion
 
 load_dotenv()
 database_path = os.getenv("DATABASE_TEST_URL")
+database_dir = None
+
+
+def fresh_database():
+    """Return the database URL for one test.
+
+    DATABASE_TEST_URL, if set, is shared by every test (run them serially).
+    Otherwise each test gets its own copy of a SQLite database seeded from
+    trivia.psql once per process, so tests cannot see each other's writes
+    and pytest -n auto can run them in parallel. The copies are removed when
+    the process exits, as background threads of a finished test's apps may
+    still query them.
+    """
+    global database_dir
+    if database_path:
+        return database_path
+
+    if not database_dir:
+        database_dir = tempfile.mkdtemp()
+        atexit.register(shutil.rmtree, database_dir, ignore_errors=True)
+        template = Flask(__name__)
+        setup_db(template, 'sqlite:///' + os.path.join(database_dir, 'template.db'))
+        with template.app_context():
+            seed_db(read_psql_dump(os.path.join(os.path.dirname(__file__), 'trivia.psql')))
+
+    fd, path = tempfile.mkstemp(suffix='.db', dir=database_dir)
+    os.close(fd)
+    shutil.copyfile(os.path.join(database_dir, 'template.db'), path)
+    return 'sqlite:///' + path
+
 
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
     def setUp(self):
         """Define test variables and initialize app."""
-        self.database_path = database_path
-        
+        self.database_path = fresh_database()
+
         self.app = create_app({
             "SQLALCHEMY_DATABASE_URI": self.database_path
         })
 
         self.client = self.app.test_client
-        self.base_url = 'http://localhost:5000'
 
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            self.db.create_all()
-    
     def tearDown(self):
         """Executed after reach test"""
         pass
@@ -38,8 +72,8 @@ class TriviaTestCase(unittest.TestCase):
     """
     def test_get_categories(self):
         # Send GET request to /categories
-        response = requests.get(f'{self.base_url}/categories')
-        data = response.json()
+        response = self.client().get('/categories')
+        data = response.get_json()
         
         # Check status code based on whether there are categories or not
         if len(data['categories']) > 0:
@@ -58,8 +92,8 @@ class TriviaTestCase(unittest.TestCase):
     
     def test_get_questions(self):
         """Test GET request to fetch questions"""
-        response = requests.get(f'{self.base_url}/questions')
-        data = response.json()
+        response = self.client().get('/questions')
+        data = response.get_json()
         
         self.assertEqual(response.status_code, 200)
         self.assertTrue(data['success'])
@@ -76,29 +110,432 @@ class TriviaTestCase(unittest.TestCase):
             'category': 1,
             'difficulty': 1
         }
-        response = requests.post(f'{self.base_url}/questions', json=new_question)
-        data = response.json()
+        response = self.client().post('/questions', json=new_question)
+        data = response.get_json()
         
         self.assertEqual(response.status_code, 200)
         self.assertTrue(data['success'])
         self.assertTrue('created' in data)
         self.assertTrue('total_questions' in data)
     
+    def test_add_question_write_behind(self):
+        """Test POST request to add a question through the write-behind queue"""
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "QUESTION_WRITE_MODE": "batched"
+        })
+        response = app.test_client().post('/questions', json={
+            'question': 'Batched question',
+            'answer': 'Batched answer',
+            'category': 1,
+            'difficulty': 1
+        })
+        data = response.get_json()
+        app.extensions['question_writer'].close()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(data['success'])
+        with app.app_context():
+            self.assertIsNotNone(Question.query.get(data['created']))
+
+    def test_add_question_write_behind_same_input_as_sync(self):
+        """Test the write-behind queue accepts what a synchronous POST accepts"""
+        question = {
+            'question': 'Batched question',
+            'answer': 'Batched answer',
+            'category': 1000,
+            'difficulty': 9
+        }
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "QUESTION_WRITE_MODE": "batched"
+        })
+        response = app.test_client().post('/questions', json=question)
+        app.extensions['question_writer'].close()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client().post('/questions', json=question).status_code, 200)
+
+    def test_add_question_write_behind_failed_row_retried_alone(self):
+        """Test one failing question does not fail the rest of its batch"""
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "QUESTION_WRITE_MODE": "batched",
+            "WRITE_BEHIND_DURABILITY": "async",
+            "WRITE_BEHIND_FLUSH_INTERVAL": 5
+        })
+        writer = app.extensions['question_writer']
+        with app.app_context():
+            existing = Question.query.first().id
+            new_id = writer.ids.allocate()
+            writer.ids._ids.extendleft([new_id, existing])
+
+            writer.submit('Duplicate id', 'Answer', 1, 1)
+            writer.submit('Good question', 'Answer', 1, 1)
+        writer.close()
+
+        self.assertEqual((writer.batches, writer.failed), (1, 1))
+        with app.app_context():
+            self.assertEqual(Question.query.get(new_id).question, 'Good question')
+
+    def test_add_question_bumps_data_version(self):
+        """Test POST request to add a question bumps its category's data version"""
+        with self.app.app_context():
+            version = DataVersion.query.get('questions:1')
+            before = version.version if version else 0
+
+        response = self.client().post('/questions', json={
+            'question': 'Versioned question',
+            'answer': 'Versioned answer',
+            'category': 1,
+            'difficulty': 1
+        })
+
+        self.assertEqual(response.status_code, 200)
+        with self.app.app_context():
+            self.assertEqual(DataVersion.query.get('questions:1').version, before + 1)
+
+    def test_play_quiz_sees_other_worker_insert(self):
+        """Test a cached quiz category is invalidated by another app's insert"""
+        config = {
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "DATA_VERSION_CHECK_INTERVAL": 0
+        }
+        worker, other_worker = create_app(config), create_app(config)
+
+        with worker.app_context():
+            previous = [q.id for q in Question.query.filter_by(category='1')]
+        quiz = {'previous_questions': previous, 'quiz_category': {'id': 1, 'type': 'Science'}}
+
+        response = worker.test_client().post('/quizzes', json=quiz)
+        self.assertIsNone(response.get_json()['question'])
+
+        created = other_worker.test_client().post('/questions', json={
+            'question': 'Question from another worker',
+            'answer': 'Answer',
+            'category': 1,
+            'difficulty': 1
+        }).get_json()['created']
+
+        response = worker.test_client().post('/quizzes', json=quiz)
+        self.assertEqual(response.get_json()['question']['id'], created)
+
+    def test_play_quiz_unknown_category_not_cached(self):
+        """Test quiz categories that do not exist get no cache entry"""
+        for category_id in [1000, 'click', 1.5]:
+            response = self.client().post('/quizzes', json={
+                'previous_questions': [],
+                'quiz_category': {'id': category_id, 'type': 'Unknown'}
+            })
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.get_json()['question'])
+
+        cache = self.app.extensions['cache']
+        self.assertFalse([key for key in cache._entries if key.startswith('quiz:')])
+
+    def test_search_questions_rate_limited(self):
+        """Test POST request to search questions is shed once over its rate"""
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "ADMISSION_LIMITS": {'search_questions': {'rate': 0.01, 'burst': 1}}
+        })
+        client = app.test_client()
+
+        self.assertEqual(client.post('/questions/search', json={'searchTerm': 'title'}).status_code, 200)
+        response = client.post('/questions/search', json={'searchTerm': 'title'})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(response.get_json()['success'])
+        self.assertTrue(int(response.headers['Retry-After']) > 0)
+
+    def test_play_quiz_preflight_not_rate_limited(self):
+        """Test a CORS preflight does not use up the rate of the request it precedes"""
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "ADMISSION_LIMITS": {'start_trivia': {'rate': 0.01, 'burst': 1}}
+        })
+        client = app.test_client()
+
+        preflight = client.options('/quizzes', headers={
+            'Origin': 'http://localhost:3000',
+            'Access-Control-Request-Method': 'POST',
+            'Access-Control-Request-Headers': 'Content-Type'
+        })
+        self.assertEqual(preflight.status_code, 200)
+
+        response = client.post('/quizzes', json={'previous_questions': []})
+        self.assertEqual(response.status_code, 200)
+
+    def test_play_quiz_shed_when_busy_categories_still_served(self):
+        """Test an expensive route over its concurrency is shed, cheap routes are not"""
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "ADMISSION_LIMITS": {'start_trivia': {'concurrency': 0}},
+            "ADMIN_ROUTES": True
+        })
+        client = app.test_client()
+
+        response = client.post('/quizzes', json={'previous_questions': []})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(client.get('/categories').status_code, 200)
+
+        stats = client.get('/admin/admission').get_json()['admission']
+        self.assertEqual(stats['routes']['start_trivia']['shed_503'], 1)
+        self.assertEqual(stats['routes']['start_trivia']['in_flight'], 0)
+
+    def test_batch(self):
+        """Test POST request to run several sub-requests in one round trip"""
+        response = self.client().post('/batch', json={'requests': [
+            {'method': 'GET', 'path': '/categories'},
+            {'method': 'GET', 'path': '/questions?page=1'},
+            {'method': 'POST', 'path': '/quizzes', 'body': {'previous_questions': []}},
+            {'method': 'GET', 'path': '/categories/1000/questions'}
+        ]})
+        data = response.get_json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual([r['status'] for r in data['responses']], [200, 200, 200, 404])
+        self.assertEqual(data['responses'][0]['body'], self.client().get('/categories').get_json())
+        self.assertTrue(data['responses'][2]['body']['question'])
+
+    def test_batch_sees_earlier_writes(self):
+        """Test a read in a batch sees a write earlier in the same batch"""
+        response = self.client().post('/batch', json={'requests': [
+            {'method': 'POST', 'path': '/questions', 'body': {
+                'question': 'Batched request question',
+                'answer': 'Answer',
+                'category': 1,
+                'difficulty': 1
+            }},
+            {'method': 'POST', 'path': '/questions/search', 'body': {'searchTerm': 'Batched request question'}}
+        ]})
+        created, search = response.get_json()['responses']
+
+        self.assertEqual(created['status'], 200)
+        self.assertIn(created['body']['created'], [q['id'] for q in search['body']['questions']])
+
+    def test_batch_invalid(self):
+        """Test POST request to batch with a nested batch"""
+        response = self.client().post('/batch', json={'requests': [{'method': 'POST', 'path': '/batch'}]})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(response.get_json()['success'])
+
+    def test_batch_body_not_an_object(self):
+        """Test POST request to batch with a JSON body that is not an object"""
+        response = self.client().post('/batch', json=[1])
+
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(response.get_json()['success'])
+
+    def test_slow_query_log(self):
+        """Test statements over the threshold are logged with their route and plan"""
+        with tempfile.TemporaryDirectory() as tmp:
+            app = create_app({
+                "SQLALCHEMY_DATABASE_URI": self.database_path,
+                "SLOW_QUERY_THRESHOLD": 0,
+                "SLOW_QUERY_EXPLAIN_SAMPLE": 1,
+                "SLOW_QUERY_DUMP_PATH": os.path.join(tmp, 'slow.jsonl'),
+                "ADMIN_ROUTES": True
+            })
+            client = app.test_client()
+
+            client.get('/categories/1/questions')
+            data = client.get('/admin/slow-queries').get_json()
+
+            self.assertTrue(data['success'])
+            entry = next(e for e in data['slow_queries'] if 'FROM questions' in e['statement'])
+            self.assertEqual(entry['route'], 'GET /categories/1/questions (category_questions)')
+            self.assertIsNotNone(entry['plan'])
+            self.assertNotIn('EXPLAIN failed', entry['plan'])
+
+            data = client.post('/admin/slow-queries/dump').get_json()
+            with open(data['path']) as f:
+                self.assertEqual(len(f.readlines()), data['dumped'])
+
+    def test_slow_query_log_disabled(self):
+        """Test the slow-query log routes are absent when the log is off"""
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "SLOW_QUERY_THRESHOLD": None,
+            "ADMIN_ROUTES": True
+        })
+
+        self.assertEqual(app.test_client().get('/admin/slow-queries').status_code, 404)
+
+    def test_slow_query_threshold_from_environment(self):
+        """Test SLOW_QUERY_THRESHOLD=None or empty in the environment turns the log off"""
+        previous = os.environ.get('SLOW_QUERY_THRESHOLD')
+        try:
+            for value, threshold in [('None', None), ('', None), ('50', 50.0)]:
+                os.environ['SLOW_QUERY_THRESHOLD'] = value
+                app = create_app({"SQLALCHEMY_DATABASE_URI": self.database_path})
+
+                self.assertEqual(app.config['SLOW_QUERY_THRESHOLD'], threshold, value)
+                self.assertEqual('slow_queries' in app.extensions, threshold is not None, value)
+        finally:
+            if previous is None:
+                del os.environ['SLOW_QUERY_THRESHOLD']
+            else:
+                os.environ['SLOW_QUERY_THRESHOLD'] = previous
+
+    def test_admin_routes_off_by_default(self):
+        """Test the /admin routes are not served unless ADMIN_ROUTES is set"""
+        client = self.client()
+
+        self.assertEqual(client.get('/admin/admission').status_code, 404)
+        self.assertEqual(client.get('/admin/slow-queries').status_code, 404)
+        self.assertEqual(client.post('/admin/slow-queries/dump').status_code, 404)
+        self.assertTrue(self.app.extensions['slow_queries'])
+
+    def test_get_questions_page_cache_after_delete(self):
+        """Test the next read after a delete waits for the rebuild instead of building inline"""
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "PAGE_CACHE_REBUILD_WAIT": 5000
+        })
+        page_cache = app.extensions['page_cache']
+        client = app.test_client()
+
+        before = client.get('/questions?page=1').get_json()
+        question_id = before['questions'][0]['id']
+        self.assertEqual(client.delete(f'/questions/{question_id}').status_code, 200)
+        data = client.get('/questions?page=1').get_json()
+
+        self.assertEqual(data['total_questions'], before['total_questions'] - 1)
+        self.assertNotIn(question_id, [q['id'] for q in data['questions']])
+        self.assertEqual((page_cache.misses, page_cache.stale), (1, 0))
+
+    def test_get_questions_page_cache_stale_after_own_change(self):
+        """Test a read after this worker's change gets the old page if the rebuild is slow"""
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "PAGE_CACHE_REBUILD_WAIT": 0
+        })
+        page_cache = app.extensions['page_cache']
+        client = app.test_client()
+
+        before = client.get('/questions?page=1').get_json()
+        # holds the rebuild thread until the read below is served
+        release = threading.Event()
+
+        def blocker():
+            release.wait()
+
+        page_cache._queue.put(('blocker', (), blocker))
+        client.post('/questions', json={
+            'question': 'Added question',
+            'answer': 'Answer',
+            'category': 1,
+            'difficulty': 1
+        })
+        data = client.get('/questions?page=1').get_json()
+        release.set()
+        page_cache.wait()
+
+        self.assertEqual(data, before)
+        self.assertEqual((page_cache.misses, page_cache.stale), (1, 1))
+        self.assertEqual(
+            client.get('/questions?page=1').get_json()['total_questions'],
+            before['total_questions'] + 1
+        )
+
+    def test_category_questions_page_cache_other_category_kept(self):
+        """Test a change in one category leaves the cached pages of the others alone"""
+        page_cache = self.app.extensions['page_cache']
+        client = self.client()
+
+        client.get('/categories/1/questions')
+        client.post('/questions', json={
+            'question': 'Question in another category',
+            'answer': 'Answer',
+            'category': 3,
+            'difficulty': 1
+        })
+        page_cache.wait()
+        client.get('/categories/1/questions')
+
+        self.assertEqual((page_cache.misses, page_cache.hits, page_cache.rebuilds), (1, 1, 0))
+
+    def test_category_questions_page_cache_stale_while_revalidate(self):
+        """Test a page changed by another worker is served stale, then rebuilt in the background"""
+        config = {
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "DATA_VERSION_CHECK_INTERVAL": 60000
+        }
+        worker, other_worker = create_app(config), create_app(config)
+        client = worker.test_client()
+        page_cache = worker.extensions['page_cache']
+
+        before = client.get('/categories/1/questions').get_json()['total_questions']
+        other_worker.test_client().post('/questions', json={
+            'question': 'Question from another worker',
+            'answer': 'Answer',
+            'category': 1,
+            'difficulty': 1
+        })
+        worker.extensions['cache'].expire()
+
+        self.assertEqual(client.get('/categories/1/questions').get_json()['total_questions'], before)
+        page_cache.wait()
+        self.assertEqual(client.get('/categories/1/questions').get_json()['total_questions'], before + 1)
+        self.assertEqual((page_cache.stale, page_cache.rebuilds), (1, 1))
+
+    def test_category_questions_page_cache_rebuilt_without_reads(self):
+        """Test a change noticed by any request rebuilds every affected cached page"""
+        config = {
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "DATA_VERSION_CHECK_INTERVAL": 60000
+        }
+        worker, other_worker = create_app(config), create_app(config)
+        client = worker.test_client()
+        page_cache = worker.extensions['page_cache']
+
+        before = client.get('/categories/1/questions').get_json()['total_questions']
+        other_worker.test_client().post('/questions', json={
+            'question': 'Question from another worker',
+            'answer': 'Answer',
+            'category': 1,
+            'difficulty': 1
+        })
+        worker.extensions['cache'].expire()
+        client.get('/categories')
+        page_cache.wait()
+
+        self.assertEqual(client.get('/categories/1/questions').get_json()['total_questions'], before + 1)
+        self.assertEqual(page_cache.stale, 0)
+
+    def test_get_questions_page_cache_memory_cap(self):
+        """Test the page cache evicts listings to stay under its byte cap"""
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "PAGE_CACHE_MAX_BYTES": 4096
+        })
+        client = app.test_client()
+        page_cache = app.extensions['page_cache']
+
+        for path in ['/questions'] + [f'/categories/{id}/questions' for id in range(1, 7)]:
+            self.assertEqual(client.get(path).status_code, 200)
+
+        self.assertTrue(0 < page_cache.size <= 4096)
+
     def test_delete_question_success(self):
         """Test DELETE request to delete a question"""
         # Create a question to delete
-        response = requests.post(f'{self.base_url}/questions', json={
+        response = self.client().post('/questions', json={
             'question': 'Test Question',
             'answer': 'Test Answer',
             'category': 1,
             'difficulty': 1
         })
-        data = response.json()
+        data = response.get_json()
         question_id = data['created']
 
         # Send DELETE request to /questions/{question_id}
-        response = requests.delete(f'{self.base_url}/questions/{question_id}')
-        data = response.json()
+        response = self.client().delete(f'/questions/{question_id}')
+        data = response.get_json()
         
         self.assertEqual(response.status_code, 200)
         self.assertTrue(data['success'])
@@ -108,8 +545,8 @@ class TriviaTestCase(unittest.TestCase):
     def test_delete_question_not_found(self):
         """Test DELETE request to delete a non-existing question"""
         # Send DELETE request to /questions/{non_existing_id}
-        response = requests.delete(f'{self.base_url}/questions/1000')
-        data = response.json()
+        response = self.client().delete('/questions/1000')
+        data = response.get_json()
         
         self.assertEqual(response.status_code, 404)
         self.assertFalse(data['success'])
@@ -117,8 +554,8 @@ class TriviaTestCase(unittest.TestCase):
     def test_delete_question_error(self):
         """Test DELETE request to delete a question with error"""
         # Send DELETE request to /questions/{invalid_id}
-        response = requests.delete(f'{self.base_url}/questions/invalid_id')
-        data = response.json()
+        response = self.client().delete('/questions/invalid_id')
+        data = response.get_json()
         
         self.assertEqual(response.status_code, 404)
         self.assertFalse(data['success'])
@@ -126,8 +563,8 @@ class TriviaTestCase(unittest.TestCase):
     def test_search_questions_success(self):
         """Test POST request to search questions"""
         # Send POST request to /questions/search
-        response = requests.post(f'{self.base_url}/questions/search', json={'searchTerm': 'title'})
-        data = response.json()
+        response = self.client().post('/questions/search', json={'searchTerm': 'title'})
+        data = response.get_json()
         
         self.assertEqual(response.status_code, 200)
         self.assertTrue(data['success'])
@@ -137,8 +574,8 @@ class TriviaTestCase(unittest.TestCase):
     def test_search_questions_no_results(self):
         """Test POST request to search questions with no results"""
         # Send POST request to /questions/search
-        response = requests.post(f'{self.base_url}/questions/search', json={'searchTerm': 'non_existing_term'})
-        data = response.json()
+        response = self.client().post('/questions/search', json={'searchTerm': 'non_existing_term'})
+        data = response.get_json()
         
         self.assertEqual(response.status_code, 200)
         self.assertTrue(data['success'])
@@ -148,15 +585,15 @@ class TriviaTestCase(unittest.TestCase):
     def test_search_questions_error(self):
         """Test POST request to search questions with error"""
         # Send POST request to /questions/search without searchTerm
-        response = requests.post(f'{self.base_url}/questions/search')
+        response = self.client().post('/questions/search')
         
         self.assertEqual(response.status_code, 500)
 
     def test_category_questions_success(self):
         """Test GET request to fetch questions by category"""
         # Send GET request to /categories/{category_id}/questions
-        response = requests.get(f'{self.base_url}/categories/1/questions')
-        data = response.json()
+        response = self.client().get('/categories/1/questions')
+        data = response.get_json()
         
         self.assertEqual(response.status_code, 200)
         self.assertTrue(data['success'])
@@ -167,15 +604,15 @@ class TriviaTestCase(unittest.TestCase):
     def test_category_questions_category_not_found(self):
         """Test GET request to fetch questions by non-existing category"""
         # Send GET request to /categories/{non_existing_category_id}/questions
-        response = requests.get(f'{self.base_url}/categories/1000/questions')
+        response = self.client().get('/categories/1000/questions')
         
         self.assertEqual(response.status_code, 404)
 
     def test_play_quiz_success(self):
         """Test POST request to play quiz"""
         # Send POST request to /quizzes with previous_questions and quiz_category
-        response = requests.post(f'{self.base_url}/quizzes', json={"previous_questions": [1, 2, 3], "quiz_category": {"id": 1, "type": "Science"}})
-        data = response.json()
+        response = self.client().post('/quizzes', json={"previous_questions": [1, 2, 3], "quiz_category": {"id": 1, "type": "Science"}})
+        data = response.get_json()
         
         self.assertEqual(response.status_code, 200)
         self.assertTrue(data['success'])
@@ -185,10 +622,199 @@ class TriviaTestCase(unittest.TestCase):
     def test_play_quiz_no_body(self):
         """Test POST request to play quiz with no request body"""
         # Send POST request to /quizzes without request body
-        response = requests.post(f'{self.base_url}/quizzes')
+        response = self.client().post('/quizzes')
         
         self.assertEqual(response.status_code, 400)
 
+
+class SnapshotTestCase(unittest.TestCase):
+    """This class represents the trivia test case for snapshot serving mode"""
+
+    def setUp(self):
+        """Compile trivia.psql into a snapshot and serve it without a database."""
+        self.tmp = tempfile.TemporaryDirectory()
+        snapshot_path = os.path.join(self.tmp.name, 'trivia.snap')
+        write_snapshot(snapshot_path, read_psql_dump(
+            os.path.join(os.path.dirname(__file__), 'trivia.psql')
+        ))
+
+        self.app = create_app({"SNAPSHOT_PATH": snapshot_path})
+        self.client = self.app.test_client
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_get_categories(self):
+        response = self.client().get('/categories')
+        data = response.get_json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['categories']['1'], 'Science')
+        self.assertEqual(len(data['categories']), 6)
+
+    def test_get_questions_page(self):
+        response = self.client().get('/questions?page=2')
+        data = response.get_json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['total_questions'], 19)
+        self.assertEqual(len(data['questions']), 9)
+        self.assertEqual(data['current_category'], 'Science')
+
+    def test_category_questions(self):
+        response = self.client().get('/categories/2/questions')
+        data = response.get_json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([q['id'] for q in data['questions']], [16, 17, 18, 19])
+        self.assertEqual(data['current_category'], 'Art')
+
+    def test_category_questions_not_found(self):
+        response = self.client().get('/categories/1000/questions')
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_search_questions(self):
+        response = self.client().post('/questions/search', json={'searchTerm': 'TITLE'})
+        data = response.get_json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([q['id'] for q in data['questions']], [5, 6])
+
+    def test_play_quiz_skips_previous_questions(self):
+        response = self.client().post('/quizzes', json={
+            'previous_questions': [20, 21],
+            'quiz_category': {'id': 1, 'type': 'Science'}
+        })
+        data = response.get_json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['question']['id'], 22)
+
+    def test_play_quiz_non_numeric_category(self):
+        response = self.client().post('/quizzes', json={
+            'previous_questions': [],
+            'quiz_category': {'id': 'click', 'type': 'click'}
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.get_json()['question'])
+
+    def test_search_questions_same_as_database(self):
+        database_client = create_app({"SQLALCHEMY_DATABASE_URI": fresh_database()}).test_client()
+
+        def search(client, term):
+            data = client.post('/questions/search', json={'searchTerm': term}).get_json()
+            return data['total_questions'], [q['id'] for q in data['questions']]
+
+        for term in ['title', 'TITLE', '%', '_', 'the %', '']:
+            self.assertEqual(search(self.client(), term), search(database_client, term), term)
+
+    def test_delete_question_read_only(self):
+        response = self.client().delete('/questions/5')
+
+        self.assertEqual(response.status_code, 405)
+        self.assertFalse(response.get_json()['success'])
+
+
+class AsyncAppTestCase(unittest.TestCase):
+    """This class represents the trivia test case for the ASGI app"""
+
+    def setUp(self):
+        database = fresh_database()
+
+        self.async_app = create_async_app({"SQLALCHEMY_DATABASE_URI": database})
+        self.client = create_app({"SQLALCHEMY_DATABASE_URI": database}).test_client
+
+    def call(self, method, path, body=None):
+        """Send one request through the ASGI interface; return (status, body)."""
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+            'headers': [(b'content-type', b'application/json')] if body is not None else [],
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': json.dumps(body).encode() if body is not None else b''}
+
+        async def send(message):
+            messages.append(message)
+
+        async def run():
+            await self.async_app(scope, receive, send)
+            await self.async_app.engine.dispose()
+
+        asyncio.run(run())
+        return messages[0]['status'], messages[1]['body']
+
+    def test_same_responses_as_flask(self):
+        for method, path, body in [
+            ('GET', '/categories', None),
+            ('GET', '/questions?page=2', None),
+            ('GET', '/categories/1000/questions', None),
+            ('GET', '/categories/2/questions', None),
+            ('GET', '/categories/x/questions', None),
+            ('DELETE', '/categories', None),
+            ('POST', '/questions/search', {'searchTerm': 'title'}),
+            ('POST', '/quizzes', {}),
+            ('POST', '/quizzes', {'previous_questions': [], 'quiz_category': {'id': 'click'}}),
+        ]:
+            response = self.client().open(path, method=method, json=body)
+            self.assertEqual(self.call(method, path, body), (response.status_code, response.data), path)
+
+    def test_startup_retried_after_failure(self):
+        """Test a failed startup is run again by the next request"""
+        directory = tempfile.mkdtemp()
+        database = os.path.join(directory, 'missing', 'trivia.db')
+        self.async_app = create_async_app({"SQLALCHEMY_DATABASE_URI": f'sqlite:///{database}'})
+
+        self.assertEqual(self.call('GET', '/categories')[0], 500)
+
+        os.mkdir(os.path.dirname(database))
+        self.assertEqual(self.call('GET', '/categories')[0], 404)
+
+    def test_add_and_delete_question(self):
+        status, body = self.call('POST', '/questions', {
+            'question': 'Async question',
+            'answer': 'Async answer',
+            'category': 1,
+            'difficulty': 1
+        })
+        created = json.loads(body)['created']
+        self.assertEqual(status, 200)
+
+        status, body = self.call('DELETE', f'/questions/{created}')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)['deleted'], created)
+
+
+class LoadTestTestCase(unittest.TestCase):
+    """This class represents the trivia test case for the load generator"""
+
+    def test_replay_all_flows(self):
+        """Replay every frontend flow in-process against seeded data"""
+        app = loadtest.in_process_app(fresh_database(), {})
+        recorder = loadtest.run(
+            lambda recorder: loadtest.Client(recorder, app=app),
+            loadtest.parse_mix(loadtest.DEFAULT_MIX), users=2, duration=0.5, seed=1
+        )
+
+        self.assertEqual(sum(recorder.errors.values()), 0)
+        self.assertIn('POST /quizzes', recorder.latencies)
+        self.assertIn('DELETE /questions/<id>', recorder.latencies)
+
+    def test_connection_errors_recorded(self):
+        """Requests that get no response are counted as errors until the deadline"""
+        recorder = loadtest.run(
+            lambda recorder: loadtest.Client(recorder, base_url='http://127.0.0.1:1', timeout=1),
+            {'browse': 1}, users=2, duration=0.3, seed=1
+        )
+
+        self.assertGreater(recorder.errors['GET /categories'], 0)
+        self.assertGreater(recorder.elapsed, 0.2)
+
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file